@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from random import seed, randrange, choice
+
+from data_access.data_base import init_db
+from data_access.data_generator import generate_random_bookings
+from data_access.engine_factory import create_db_engine, create_sessions
+from business.AsyncManager import AsyncSearchManager
+from business.SearchManager import SearchManager
+
+
+def generate_queries(n: int, s: int = 1) -> list:
+    seed(s)
+    first_day = date(date.today().year, 1, 1)
+    queries = []
+    for _ in range(n):
+        start_date = first_day + timedelta(days=randrange(365))
+        queries.append((start_date, start_date + timedelta(days=randrange(1, 6)), randrange(1, 4),
+                        choice([None, "Olten", "Zürich"])))
+    return queries
+
+
+def run_sync(db_file: str, queries: list) -> float:
+    session, read_session = create_sessions(db_file)
+    sm = SearchManager(session, read_session=read_session)
+    start = time.perf_counter()
+    for query in queries:
+        sm.search_hotels_with_available_rooms(*query)
+    return time.perf_counter() - start
+
+
+async def run_async(db_file: str, queries: list, workers: int) -> float:
+    session, read_session = create_sessions(db_file, read_pool_size=workers)
+    with ThreadPoolExecutor(workers) as executor:
+        sm = AsyncSearchManager(session, read_session=read_session, executor=executor)
+        start = time.perf_counter()
+        await asyncio.gather(*(sm.search_hotels_with_available_rooms(*query) for query in queries))
+        return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the throughput of concurrent hotel searches "
+                                                 "with the sync and the async SearchManager.")
+    parser.add_argument("--db-file", help="database to search, a fresh example database by default")
+    parser.add_argument("--bookings", type=int, default=20000, help="random bookings added to the example database")
+    parser.add_argument("--searches", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = args.db_file
+        if db_file is None:
+            db_file = str(Path(tmp).joinpath("search.db"))
+            init_db(db_file, generate_example_data=True)
+            generate_random_bookings(create_db_engine(db_file), k=args.bookings)
+
+        queries = generate_queries(args.searches)
+        sync_time = run_sync(db_file, queries)
+        async_time = asyncio.run(run_async(db_file, queries, args.workers))
+        print(f"sync:  {len(queries)} searches in {sync_time:.2f}s ({len(queries) / sync_time:.0f} searches/s)")
+        print(f"async: {len(queries)} searches in {async_time:.2f}s ({len(queries) / async_time:.0f} searches/s, "
+              f"{args.workers} workers)")
@@ -0,0 +1,112 @@
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from multiprocessing import Pool
+from pathlib import Path
+from random import seed, choice, randrange
+
+from sqlalchemy import select, text
+
+from data_access.data_base import init_db
+from data_access.engine_factory import create_db_engine, create_session
+from data_models.models import Room, Guest
+from business.BookingManager import BookingManager
+
+QUERY_OVERLAPS = text("""
+    SELECT COUNT(*)
+    FROM booking a JOIN booking b
+      ON a.room_hotel_id = b.room_hotel_id AND a.room_number = b.room_number AND a.id < b.id
+     AND a.start_date <= b.end_date AND a.end_date >= b.start_date
+""")
+
+
+def _open(db_file: str, worker: int):
+    logging.getLogger("business.BookingManager").setLevel(logging.WARNING)
+    session = create_session(db_file)
+    rooms = session.execute(select(Room.hotel_id, Room.number)).all()
+    guests = session.execute(select(Guest.id)).scalars().all()
+    session.remove()
+    seed(worker)
+    return session, BookingManager(session), rooms, guests
+
+
+def _random_stay(first_day: date, days: int):
+    start_date = first_day + timedelta(days=randrange(days))
+    return start_date, start_date + timedelta(days=randrange(1, 4))
+
+
+def book_randomly(db_file: str, worker: int, bookings: int, days: int) -> tuple:
+    session, bm, rooms, guests = _open(db_file, worker)
+    first_day = date(date.today().year + 1, 1, 1)
+    accepted = 0
+    for _ in range(bookings):
+        hotel_id, room_number = choice(rooms)
+        start_date, end_date = _random_stay(first_day, days)
+        if bm.reserve_room(hotel_id, room_number, choice(guests), 1, start_date, end_date) is not None:
+            accepted += 1
+    session.get_bind().dispose()
+    return accepted, bookings
+
+
+def import_randomly(db_file: str, worker: int, bookings: int, days: int, batch_size: int) -> tuple:
+    # bulk imports of the same rooms and days, racing the reservations of the other workers
+    session, bm, rooms, guests = _open(db_file, worker)
+    first_day = date(date.today().year + 1, 1, 1)
+    accepted = 0
+    for n in range(0, bookings, batch_size):
+        batch = []
+        for _ in range(min(batch_size, bookings - n)):
+            hotel_id, room_number = choice(rooms)
+            start_date, end_date = _random_stay(first_day, days)
+            batch.append(dict(room_hotel_id=hotel_id, room_number=room_number, guest_id=choice(guests),
+                              number_of_guests=1, start_date=start_date, end_date=end_date))
+        accepted += sum(1 for result in bm.create_bookings_bulk(batch) if result['accepted'])
+    session.get_bind().dispose()
+    return accepted, bookings
+
+
+def run(db_file: str, workers: int, bookings: int, days: int, importers: int = 0, batch_size: int = 20) -> int:
+    engine = create_db_engine(db_file)
+    with engine.connect() as connection:
+        overlaps_before = connection.execute(QUERY_OVERLAPS).scalar()
+
+    start = time.perf_counter()
+    with Pool(workers + importers) as pool:
+        jobs = [pool.apply_async(book_randomly, (db_file, worker, bookings, days)) for worker in range(workers)]
+        jobs += [pool.apply_async(import_randomly, (db_file, workers + worker, bookings, days, batch_size))
+                 for worker in range(importers)]
+        results = [job.get() for job in jobs]
+    elapsed = time.perf_counter() - start
+
+    with engine.connect() as connection:
+        overlaps = connection.execute(QUERY_OVERLAPS).scalar() - overlaps_before
+    accepted = sum(result[0] for result in results)
+    attempted = sum(result[1] for result in results)
+    print(f"{workers} workers and {importers} importers, {attempted} attempts, {accepted} bookings created in {elapsed:.2f}s "
+          f"({attempted / elapsed:.0f} attempts/s)")
+    print(f"Overlapping bookings created: {overlaps}")
+    return overlaps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Books the same rooms from several processes, with single "
+                                                 "reservations and bulk imports, and checks that no overlapping "
+                                                 "bookings are created.")
+    parser.add_argument("--db-file", help="database to book against, a fresh example database by default")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--bookings", type=int, default=200, help="booking attempts per worker")
+    parser.add_argument("--days", type=int, default=30, help="number of days the start dates are drawn from")
+    parser.add_argument("--importers", type=int, default=2,
+                        help="processes creating the same number of bookings with create_bookings_bulk")
+    parser.add_argument("--batch-size", type=int, default=20, help="bookings per bulk import")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = args.db_file
+        if db_file is None:
+            db_file = str(Path(tmp).joinpath("stress.db"))
+            init_db(db_file, generate_example_data=True)
+        sys.exit(1 if run(db_file, args.workers, args.bookings, args.days, args.importers, args.batch_size) else 0)
@@ -0,0 +1,25 @@
+from datetime import date
+
+from data_access.data_base import init_db
+from data_access.data_generator import BULK_START_DATE, generate_system_data, generate_bulk_data, \
+    generate_bulk_data_parallel
+from data_access.engine_factory import create_db_engine
+
+SCALES = {
+    "small": dict(hotels=10, rooms_per_hotel=10, guests=100, bookings=1_000),
+    "medium": dict(hotels=1_000, rooms_per_hotel=20, guests=10_000, bookings=100_000),
+    "large": dict(hotels=50_000, rooms_per_hotel=20, guests=200_000, bookings=1_000_000),
+}
+
+
+def build_dataset(db_file: str, hotels: int, rooms_per_hotel: int, guests: int, bookings: int, s: int = 1,
+                  chunk_size: int = 10_000, shards: int = 1, start_date: date = BULK_START_DATE):
+    init_db(db_file)
+    engine = create_db_engine(db_file)
+    generate_system_data(engine)
+    if shards == 1:
+        generate_bulk_data(engine, hotels, rooms_per_hotel, guests, bookings, s, chunk_size, start_date=start_date)
+    else:
+        generate_bulk_data_parallel(db_file, hotels, rooms_per_hotel, guests, bookings, s, chunk_size, shards,
+                                    start_date=start_date)
+    engine.dispose()
@@ -0,0 +1,78 @@
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from data_access.engine_factory import DEFAULT_DB_FILE
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ENTRY_POINTS = ["business.HotelManager", "business.BookingManager", "business.SearchManager",
+                "business.UserManager", "business.AsyncManager"]
+
+# what the admin console does before it shows its first menu
+CONSOLE_STARTUP = """
+import time
+start = time.perf_counter()
+from business.HotelManager import HotelManager
+from data_access.data_base import init_db
+from data_access.engine_factory import create_sessions
+init_db({db_file!r}, generate_example_data=True, migrate=True)
+session, read_session = create_sessions({db_file!r})
+HotelManager(session, read_session=read_session).get_all_hotels()
+print((time.perf_counter() - start) * 1000)
+"""
+
+# cold start budget of the console application in ms, checked against the fastest run
+COLD_START_BUDGET_MS = 1000
+
+
+def import_times(module: str) -> list:
+    # parses the "import time: self [us] | cumulative | imported package" lines written to stderr
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                               capture_output=True, text=True, check=True)
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return times
+
+
+def console_startup(db_file: str) -> float:
+    completed = subprocess.run([sys.executable, "-c", CONSOLE_STARTUP.format(db_file=db_file)], cwd=ROOT,
+                               capture_output=True, text=True, check=True)
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the import time of the entry points and the cold start "
+                                                 "of the console application.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest modules to list")
+    parser.add_argument("--budget", type=float, default=COLD_START_BUDGET_MS, help="cold start budget in ms")
+    args = parser.parse_args()
+
+    fastest = {}
+    for module in ENTRY_POINTS:
+        runs = [import_times(module) for _ in range(args.repeat)]
+        # the entry point itself is the last line, its cumulative time is the whole import
+        fastest[module] = min(runs, key=lambda times: times[-1][2])
+        print(f"{module:<30} {fastest[module][-1][2]:8.1f} ms")
+
+    print(f"\nSlowest modules by self time ({ENTRY_POINTS[0]}):")
+    slowest = sorted(fastest[ENTRY_POINTS[0]], key=lambda times: times[1], reverse=True)
+    for name, self_ms, cumulative_ms in slowest[:args.top]:
+        print(f"  {name:<50} {self_ms:8.1f} ms  (cumulative {cumulative_ms:.1f} ms)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # the copy keeps the committed database unchanged when it is migrated
+        db_file = str(Path(tmp).joinpath("database.db"))
+        shutil.copy(DEFAULT_DB_FILE, db_file)
+        startup_ms = min(console_startup(db_file) for _ in range(args.repeat))
+
+    print(f"\nConsole cold start: {startup_ms:.1f} ms (budget {args.budget:.0f} ms)")
+    sys.exit(1 if startup_ms > args.budget else 0)
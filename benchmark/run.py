@@ -0,0 +1,259 @@
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from random import Random
+
+from sqlalchemy import select, func
+
+from benchmark.dataset import SCALES, build_dataset
+from business.BookingManager import BookingManager
+from business.CredentialCache import CredentialCache
+from business.HotelManager import HotelManager
+from business.SearchManager import SearchManager
+from business.UserManager import UserManager
+from data_access.data_generator import BULK_START_DATE
+from data_access.engine_factory import create_sessions
+from data_models.models import Address, Hotel, Room, Booking, Guest
+
+BASELINE_FILE = Path(__file__).resolve().parent.joinpath("baseline.json")
+
+# slowdowns below this are timer noise for sub-millisecond methods
+MIN_DELTA_MS = 0.5
+
+
+class BenchmarkContext(object):
+    def __init__(self, db_file: str, s: int = 1):
+        self.session, self.read_session = create_sessions(db_file)
+        self.sm = SearchManager(self.session, read_session=self.read_session)
+        self.sm_room_nights = SearchManager(self.session, read_session=self.read_session, use_room_nights=True)
+        self.bm = BookingManager(self.session, read_session=self.read_session)
+        self.hm = HotelManager(self.session, read_session=self.read_session)
+        self.um = UserManager(self.session)
+        self.um_cached = UserManager(self.session, credential_cache=CredentialCache())
+        self.random = Random(s)
+
+        self.rooms = self.read_session.execute(select(Room.id, Room.hotel_id, Room.number).limit(10_000)).all()
+        self.hotel_ids = sorted({room.hotel_id for room in self.rooms})
+        self.hotels = self.read_session.execute(select(Hotel).where(Hotel.id.in_(self.hotel_ids))).scalars().all()
+        self.address_ids = sorted({hotel.address_id for hotel in self.hotels})
+        self.guest_ids = self.read_session.execute(select(Guest.id).limit(10_000)).scalars().all()
+        self.max_booking_id = self.read_session.execute(select(func.max(Booking.id))).scalar() or 0
+        self.cities = self.read_session.execute(select(Address.city).distinct()).scalars().all()
+        self.first_day = BULK_START_DATE
+        # later dates, so created bookings do not conflict with the generated ones
+        self.next_free_day = date(BULK_START_DATE.year + 2, 1, 1)
+        self.created_bookings = []
+        self.created_hotels = []
+
+    def random_stay(self):
+        start_date = self.first_day + timedelta(days=self.random.randrange(365))
+        return start_date, start_date + timedelta(days=self.random.randrange(1, 6))
+
+    def random_month(self):
+        start_date = self.first_day + timedelta(days=self.random.randrange(335))
+        return start_date, start_date + timedelta(days=30)
+
+    def free_stay(self):
+        self.next_free_day += timedelta(days=3)
+        return self.next_free_day, self.next_free_day + timedelta(days=1)
+
+
+def bench_search(ctx: BenchmarkContext):
+    yield "SearchManager.get_all_cities_with_hotels", lambda: ctx.sm.get_all_cities_with_hotels()
+    yield "SearchManager.get_available_rooms", lambda: ctx.sm.get_available_rooms(
+        ctx.random.choice(ctx.hotel_ids), *ctx.random_stay(), 2)
+    yield "SearchManager.get_available_hotels_by_city_stars_and_guests", \
+        lambda: ctx.sm.get_available_hotels_by_city_stars_and_guests(
+            *ctx.random_stay(), 2, ctx.random.choice(ctx.cities), 3, False)
+    yield "SearchManager.search_hotels_with_available_rooms", lambda: ctx.sm.search_hotels_with_available_rooms(
+        *ctx.random_stay(), 2, ctx.random.choice(ctx.cities), 3, False)
+    yield "SearchManager.search_hotels_with_available_rooms[room_nights]", \
+        lambda: ctx.sm_room_nights.search_hotels_with_available_rooms(
+            *ctx.random_stay(), 2, ctx.random.choice(ctx.cities), 3, False)
+    yield "SearchManager.search_flexible_dates", lambda: ctx.sm.search_flexible_dates(
+        *ctx.random_month(), 3, 2, ctx.random.choice(ctx.cities), 3, False)
+    yield "SearchManager.search_hotels", lambda: ctx.sm.search_hotels(ctx.random.choice(ctx.cities)[:3])
+    # matches every generated hotel, all of them are ranked
+    yield "SearchManager.search_hotels[common word]", lambda: ctx.sm.search_hotels("hotel")
+    yield "SearchManager.get_room_details", lambda: ctx.sm.get_room_details(ctx.random.choice(ctx.hotels), 3)
+
+
+def bench_booking(ctx: BenchmarkContext):
+    def create_booking():
+        room = ctx.random.choice(ctx.rooms)
+        booking_id = ctx.bm.create_booking(room.hotel_id, room.number, ctx.random.choice(ctx.guest_ids), 1,
+                                           *ctx.free_stay(), "benchmark")
+        ctx.created_bookings.append(booking_id)
+
+    def create_bookings_bulk():
+        bookings = []
+        for _ in range(100):
+            room = ctx.random.choice(ctx.rooms)
+            start_date, end_date = ctx.free_stay()
+            bookings.append(dict(room_hotel_id=room.hotel_id, room_number=room.number,
+                                 guest_id=ctx.random.choice(ctx.guest_ids), number_of_guests=1,
+                                 start_date=start_date, end_date=end_date))
+        results = ctx.bm.create_bookings_bulk(bookings)
+        ctx.created_bookings.extend(result['booking_id'] for result in results if result['accepted'])
+
+    def update_booking():
+        ctx.bm.update_booking(ctx.random.randrange(1, ctx.max_booking_id + 1), comment="benchmark")
+
+    def delete_booking():
+        if ctx.created_bookings:
+            ctx.bm.delete_booking(ctx.created_bookings.pop())
+
+    yield "BookingManager.create_booking", create_booking
+    yield "BookingManager.create_bookings_bulk[100]", create_bookings_bulk
+    yield "BookingManager.update_booking", update_booking
+    yield "BookingManager.delete_booking", delete_booking
+    yield "BookingManager.get_bookings_of", lambda: ctx.bm.get_bookings_of(ctx.random.choice(ctx.guest_ids))
+    yield "BookingManager.get_bookings_by_hotel", lambda: ctx.bm.get_bookings_by_hotel(
+        ctx.random.choice(ctx.hotel_ids))
+    yield "BookingManager.get_guest", lambda: ctx.bm.get_guest(ctx.random.choice(ctx.guest_ids))
+    yield "BookingManager.get_available_rooms", lambda: ctx.bm.get_available_rooms(
+        ctx.random.choice(ctx.hotels), *ctx.random_stay(), 2)
+    yield "BookingManager.get_all_bookings", lambda: ctx.bm.get_all_bookings()
+
+
+def bench_user(ctx: BenchmarkContext):
+    def login():
+        ctx.um.login("admin", "password")
+        ctx.um.logout()
+
+    # every login but the first is answered by the credential cache
+    def login_cached():
+        ctx.um_cached.login("admin", "password")
+        ctx.um_cached.logout()
+
+    yield "UserManager.login", login
+    yield "UserManager.login[cached]", login_cached
+
+
+def bench_hotel(ctx: BenchmarkContext):
+    def add_hotel():
+        ctx.hm.add_hotel("Benchmark Hotel", 3, Address(street="Teststrasse 1", zip="4600", city="Olten"),
+                         [Room(number=f"{n:02d}", type="double room", max_guests=2, price=150.0) for n in range(10)])
+        ctx.created_hotels.append(ctx.session.execute(select(func.max(Room.hotel_id))).scalar())
+
+    def remove_hotel():
+        if ctx.created_hotels:
+            ctx.hm.remove_hotel(ctx.created_hotels.pop())
+
+    def update_room():
+        room = ctx.random.choice(ctx.rooms)
+        ctx.hm.update_room(room.id, room.number, "double room", 2, "benchmark", "TV", 150.0)
+
+    yield "HotelManager.add_hotel", add_hotel
+    yield "HotelManager.get_all_hotels", lambda: ctx.hm.get_all_hotels()
+    yield "HotelManager.get_rooms_by_hotel_id", lambda: ctx.hm.get_rooms_by_hotel_id(ctx.random.choice(ctx.hotel_ids))
+    yield "HotelManager.get_occupancy_stats", lambda: ctx.hm.get_occupancy_stats(
+        *ctx.random_stay(), ctx.random.choice(ctx.hotel_ids))
+    yield "HotelManager.update_hotel", lambda: ctx.hm.update_hotel(ctx.random.choice(ctx.hotel_ids), "Benchmark", 3)
+    yield "HotelManager.update_address", lambda: ctx.hm.update_address(
+        ctx.random.choice(ctx.address_ids), "Teststrasse 2", ctx.random.choice(ctx.cities), "4600")
+    yield "HotelManager.update_room", update_room
+    yield "HotelManager.remove_hotel", remove_hotel
+
+
+BENCHMARKS = [bench_search, bench_booking, bench_user, bench_hotel]
+
+# methods that return whole tables are only run a few times on large datasets
+HEAVY = {"BookingManager.get_all_bookings", "HotelManager.get_all_hotels"}
+
+
+def measure(function, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'repeat': repeat,
+        'min_ms': min(timings),
+        'median_ms': statistics.median(timings),
+        'mean_ms': statistics.fmean(timings),
+        'max_ms': max(timings)
+    }
+
+
+def run_benchmarks(db_file: str, repeat: int, heavy_repeat: int, selected: str = None) -> dict:
+    ctx = BenchmarkContext(db_file)
+    results = {}
+    for benchmarks in BENCHMARKS:
+        for name, function in benchmarks(ctx):
+            if selected and selected not in name:
+                continue
+            results[name] = measure(function, heavy_repeat if name in HEAVY else repeat)
+            print(f"{name:<65} {results[name]['median_ms']:10.3f} ms")
+    return results
+
+
+def check_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference and result['median_ms'] > reference['median_ms'] * (1 + tolerance) \
+                and result['median_ms'] - reference['median_ms'] > MIN_DELTA_MS:
+            regressions.append((name, reference['median_ms'], result['median_ms']))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the public manager methods on a synthetic dataset.")
+    parser.add_argument("--scale", choices=SCALES.keys(), default="small")
+    parser.add_argument("--db-file", help="dataset to use; built at the given scale if the file does not exist")
+    parser.add_argument("--shards", type=int, default=1, help="processes used to build the dataset")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--heavy-repeat", type=int, default=3)
+    parser.add_argument("--only", help="run only benchmarks whose name contains this text")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE), help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown of the median against the baseline, 0.5 = 50%%")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as new baseline")
+    args = parser.parse_args()
+
+    logging.getLogger("business.BookingManager").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = args.db_file or str(Path(tmp).joinpath(f"benchmark_{args.scale}.db"))
+        if not Path(db_file).is_file():
+            print(f"Building {args.scale} dataset: {SCALES[args.scale]}")
+            start = time.perf_counter()
+            build_dataset(db_file, **SCALES[args.scale], shards=args.shards)
+            print(f"Dataset built in {time.perf_counter() - start:.1f}s")
+        results = run_benchmarks(db_file, args.repeat, args.heavy_repeat, args.only)
+
+    report = {
+        'scale': args.scale,
+        'dataset': SCALES[args.scale],
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif Path(args.baseline).is_file():
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['scale'] != args.scale:
+            print(f"Baseline is for scale {baseline['scale']}, skipping regression check")
+        else:
+            regressions = check_regressions(results, baseline['results'], args.tolerance)
+            for name, before, after in regressions:
+                print(f"REGRESSION {name}: {before:.3f} ms -> {after:.3f} ms")
+            sys.exit(1 if regressions else 0)
@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import weakref
+from concurrent.futures import Executor
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session, scoped_session
+
+from business.BookingManager import BookingManager
+from business.HotelManager import HotelManager
+from business.SearchManager import SearchManager
+from business.UserManager import UserManager
+
+
+class PlainRecord(SimpleNamespace):
+    '''
+    Kopie eines ORM-Objekts mit den Spalten und den bereits geladenen Beziehungen.
+    Wird im Worker-Thread erstellt, auf dem Event Loop löst ein Zugriff deshalb
+    kein Nachladen über die Session eines anderen Threads aus. Als Argument an
+    eine Methode übergeben, wird das Objekt im Worker-Thread neu geladen.
+    '''
+
+    def __init__(self, model, identity, **fields):
+        super().__init__(**fields)
+        self._model = model
+        self._identity = identity
+
+
+# column values that are returned as they are
+_SCALAR_TYPES = (type(None), bool, int, float, str, bytes, Decimal, date, datetime)
+
+
+def to_plain(value, _parents: tuple = ()):
+    # ORM objects become PlainRecords, recursively for lists, tuples, dicts and result rows
+    if type(value) in _SCALAR_TYPES:
+        return value
+    if isinstance(value, (list, tuple, set)):
+        return type(value)(to_plain(item, _parents) for item in value)
+    if isinstance(value, dict):
+        return {key: to_plain(item, _parents) for key, item in value.items()}
+    if isinstance(value, Row):
+        # rows of plain columns are immutable values already
+        if all(type(item) in _SCALAR_TYPES for item in value):
+            return value
+        return tuple(to_plain(item, _parents) for item in value)
+    state = inspect(value, raiseerr=False)
+    if state is None or not hasattr(state, "mapper"):
+        return value
+    fields = {attribute.key: getattr(value, attribute.key) for attribute in state.mapper.column_attrs}
+    parents = _parents + (value,)
+    for relationship in state.mapper.relationships:
+        # only what is loaded already, a back reference to an enclosing object is left out
+        if relationship.key in state.unloaded:
+            continue
+        related = getattr(value, relationship.key)
+        if related is not None and not isinstance(related, list) and any(related is p for p in parents):
+            continue
+        fields[relationship.key] = to_plain(related, parents)
+    return PlainRecord(type(value), state.identity, **fields)
+
+
+def from_plain(session: Session, value):
+    if isinstance(value, PlainRecord):
+        return session.get(value._model, value._identity)
+    if isinstance(value, list):
+        return [from_plain(session, item) for item in value]
+    return value
+
+
+class AsyncManager(object):
+    '''
+    Asynchrone Fassade für einen Manager. Jede Methode des synchronen Managers wird als
+    Coroutine angeboten und in einem Thread Pool ausgeführt, damit der Event Loop nicht
+    auf SQLite wartet. Die Manager müssen mit scoped_sessions erstellt werden, dann
+    arbeitet jeder Worker-Thread mit seiner eigenen Session und Verbindung.
+    Resultate werden im Worker-Thread in PlainRecords umgewandelt. Jeder asyncio Task
+    erhält einen eigenen Manager, so teilen sich gleichzeitige Anfragen keinen Zustand
+    (z.B. den angemeldeten Benutzer des UserManagers).
+    '''
+
+    def __init__(self, factory, executor: Executor = None):
+        self._factory = factory
+        self._executor = executor
+        self._managers = weakref.WeakKeyDictionary()
+        self._default_manager = None
+
+    def _manager(self):
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is None:
+            if self._default_manager is None:
+                self._default_manager = self._factory()
+            return self._default_manager
+        manager = self._managers.get(task)
+        if manager is None:
+            manager = self._managers[task] = self._factory()
+        return manager
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        manager = self._manager()
+        attribute = getattr(manager, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            # runs in the worker thread: arguments are loaded and results copied with its own session
+            session = manager._read_session
+            try:
+                args = [from_plain(session, arg) for arg in args]
+                kwargs = {key: from_plain(session, arg) for key, arg in kwargs.items()}
+                return to_plain(attribute(*args, **kwargs))
+            finally:
+                # one transaction per call, the thread's connections go back to the pool
+                for scoped in {id(manager._session): manager._session, id(session): session}.values():
+                    if isinstance(scoped, scoped_session):
+                        scoped.remove()
+
+        @functools.wraps(attribute)
+        async def run_in_executor(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(call, *args, **kwargs))
+
+        return run_in_executor
+
+
+class AsyncSearchManager(AsyncManager):
+    def __init__(self, session, *args, executor: Executor = None, **kwargs):
+        super().__init__(functools.partial(SearchManager, session, *args, **kwargs), executor)
+
+
+class AsyncBookingManager(AsyncManager):
+    def __init__(self, session, *args, executor: Executor = None, **kwargs):
+        super().__init__(functools.partial(BookingManager, session, *args, **kwargs), executor)
+
+
+class AsyncHotelManager(AsyncManager):
+    def __init__(self, session, *args, executor: Executor = None, **kwargs):
+        super().__init__(functools.partial(HotelManager, session, *args, **kwargs), executor)
+
+
+class AsyncUserManager(AsyncManager):
+    def __init__(self, session, *args, executor: Executor = None, **kwargs):
+        super().__init__(functools.partial(UserManager, session, *args, **kwargs), executor)
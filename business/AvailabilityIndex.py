@@ -0,0 +1,204 @@
+import sqlite3
+import threading
+from bisect import bisect_right
+from datetime import date, datetime
+from pathlib import Path
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from data_models.models import Room, Booking
+
+
+def as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+class RoomOccupancy(object):
+    '''
+    Belegung eines Zimmers: Buchungsintervalle sortiert nach Startdatum.
+    Zusätzlich wird das laufende Maximum der Enddaten gehalten, damit eine
+    Überschneidung mit einem Zeitraum per Binärsuche geprüft werden kann.
+    '''
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        self._booking_ids = []
+        self._max_ends = []
+
+    def __len__(self):
+        return len(self._starts)
+
+    def add(self, booking_id: int, start_date: date, end_date: date):
+        i = bisect_right(self._starts, start_date)
+        self._starts.insert(i, start_date)
+        self._ends.insert(i, end_date)
+        self._booking_ids.insert(i, booking_id)
+        self._update_max_ends(i)
+
+    def remove(self, booking_id: int) -> bool:
+        try:
+            i = self._booking_ids.index(booking_id)
+        except ValueError:
+            return False
+        del self._starts[i]
+        del self._ends[i]
+        del self._booking_ids[i]
+        del self._max_ends[i]
+        self._update_max_ends(i)
+        return True
+
+    def is_free(self, start_date: date, end_date: date) -> bool:
+        # all bookings with start <= end_date are candidates, one of them overlaps
+        # if the latest end among them reaches start_date
+        i = bisect_right(self._starts, end_date)
+        return i == 0 or self._max_ends[i - 1] < start_date
+
+    def _update_max_ends(self, i: int):
+        del self._max_ends[i:]
+        current = self._max_ends[-1] if self._max_ends else None
+        for end in self._ends[i:]:
+            current = end if current is None or end > current else current
+            self._max_ends.append(current)
+
+
+class AvailabilityIndex(object):
+    '''
+    In-Memory Index der Zimmerbelegung. Zimmer und Buchungen eines Hotels werden
+    beim ersten Zugriff einmalig geladen, danach werden Verfügbarkeitsabfragen
+    ohne Datenbankzugriff beantwortet. Der BookingManager hält den Index bei
+    jeder Änderung einer Buchung aktuell.
+    Mit db_file prüft der Index vor jeder Abfrage PRAGMA data_version auf einer
+    eigenen Verbindung: hat irgendeine andere Verbindung (auch eines anderen
+    Prozesses) seither etwas geschrieben, wird er verworfen und neu geladen.
+    Ohne db_file ist er nur korrekt, solange alle Schreibzugriffe über die
+    Manager dieses Prozesses laufen.
+    '''
+
+    def __init__(self, db_file: str = None):
+        self._lock = threading.RLock()
+        # data_version only changes for commits of other connections, so the watcher never writes
+        self._watcher = None
+        self._data_version = None
+        if db_file is not None:
+            self._watcher = sqlite3.connect(f"{Path(db_file).resolve().as_uri()}?mode=ro", uri=True,
+                                            check_same_thread=False)
+        self._loaded_hotels = set()
+        # hotel_id -> [(room_id, room_number, max_guests)]
+        self._rooms_by_hotel = {}
+        # (hotel_id, room_number) -> RoomOccupancy
+        self._occupancy = {}
+        # booking_id -> (hotel_id, room_number)
+        self._booking_rooms = {}
+
+    def load(self, session: Session, hotel_ids=None):
+        with self._lock:
+            self._check_data_version()
+            if hotel_ids is None:
+                query_hotels = select(Room.hotel_id).distinct()
+                hotel_ids = session.execute(query_hotels).scalars().all()
+            missing = [hotel_id for hotel_id in hotel_ids if hotel_id not in self._loaded_hotels]
+            if not missing:
+                return
+
+            query_rooms = select(Room.id, Room.hotel_id, Room.number, Room.max_guests).where(
+                Room.hotel_id.in_(missing)
+            )
+            for hotel_id in missing:
+                self._rooms_by_hotel[hotel_id] = []
+            for room_id, hotel_id, number, max_guests in session.execute(query_rooms):
+                self._rooms_by_hotel[hotel_id].append((room_id, number, max_guests))
+                self._occupancy.setdefault((hotel_id, number), RoomOccupancy())
+
+            query_bookings = select(
+                Booking.id, Booking.room_hotel_id, Booking.room_number, Booking.start_date, Booking.end_date
+            ).where(Booking.room_hotel_id.in_(missing))
+            for booking_id, hotel_id, number, start_date, end_date in session.execute(query_bookings):
+                self._add(booking_id, hotel_id, number, start_date, end_date)
+
+            self._loaded_hotels.update(missing)
+
+    def _check_data_version(self):
+        # every commit counts, also the ones of this process' writer: the index then reloads the hotels
+        # it is asked for, the in-place updates of the BookingManager only save work without a watcher
+        if self._watcher is None:
+            return
+        data_version = self._watcher.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self.invalidate()
+            self._data_version = data_version
+
+    def close(self):
+        with self._lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+
+    def invalidate(self, hotel_id: int = None):
+        with self._lock:
+            if hotel_id is None:
+                self._loaded_hotels.clear()
+                self._rooms_by_hotel.clear()
+                self._occupancy.clear()
+                self._booking_rooms.clear()
+                return
+            self._loaded_hotels.discard(hotel_id)
+            for room_id, number, max_guests in self._rooms_by_hotel.pop(hotel_id, []):
+                self._occupancy.pop((hotel_id, number), None)
+            self._booking_rooms = {
+                booking_id: key for booking_id, key in self._booking_rooms.items() if key[0] != hotel_id
+            }
+
+    def add_booking(self, booking_id: int, hotel_id: int, room_number: str, start_date: date, end_date: date):
+        with self._lock:
+            if hotel_id in self._loaded_hotels:
+                self._add(booking_id, hotel_id, room_number, start_date, end_date)
+
+    def remove_booking(self, booking_id: int):
+        with self._lock:
+            key = self._booking_rooms.pop(booking_id, None)
+            if key is not None and key in self._occupancy:
+                self._occupancy[key].remove(booking_id)
+
+    def update_booking(self, booking_id: int, hotel_id: int, room_number: str, start_date: date, end_date: date):
+        with self._lock:
+            self.remove_booking(booking_id)
+            self.add_booking(booking_id, hotel_id, room_number, start_date, end_date)
+
+    def is_available(self, session: Session, hotel_id: int, room_number: str, start_date: date, end_date: date):
+        with self._lock:
+            self.load(session, [hotel_id])
+            occupancy = self._occupancy.get((hotel_id, room_number))
+            return occupancy is not None and occupancy.is_free(as_date(start_date), as_date(end_date))
+
+    def get_available_room_ids(self, session: Session, hotel_ids, start_date: date, end_date: date, guests: int):
+        start_date, end_date = as_date(start_date), as_date(end_date)
+        with self._lock:
+            self.load(session, hotel_ids)
+            return [
+                room_id
+                for hotel_id in hotel_ids
+                for room_id, number, max_guests in self._rooms_by_hotel.get(hotel_id, [])
+                if max_guests >= guests and self._occupancy[(hotel_id, number)].is_free(start_date, end_date)
+            ]
+
+    def get_available_hotel_ids(self, session: Session, hotel_ids, start_date: date, end_date: date, guests: int):
+        start_date, end_date = as_date(start_date), as_date(end_date)
+        with self._lock:
+            self.load(session, hotel_ids)
+            return {
+                hotel_id
+                for hotel_id in hotel_ids
+                if any(
+                    max_guests >= guests and self._occupancy[(hotel_id, number)].is_free(start_date, end_date)
+                    for room_id, number, max_guests in self._rooms_by_hotel.get(hotel_id, [])
+                )
+            }
+
+    def _add(self, booking_id, hotel_id, room_number, start_date, end_date):
+        occupancy = self._occupancy.setdefault((hotel_id, room_number), RoomOccupancy())
+        occupancy.add(booking_id, as_date(start_date), as_date(end_date))
+        self._booking_rooms[booking_id] = (hotel_id, room_number)
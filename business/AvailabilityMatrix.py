@@ -0,0 +1,95 @@
+from datetime import date, timedelta
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import select, and_, cast, func, Integer, Select
+from sqlalchemy.orm import Session
+
+from business.AvailabilityIndex import as_date
+from data_models.models import Booking
+
+
+class AvailabilityMatrix(object):
+    '''
+    Belegungsmatrix Zimmer × Tage für ein Datumsfenster. Die Buchungsintervalle
+    werden einmalig geladen und als Differenzen eingetragen, die kumulierten
+    Summen pro Zimmer ergeben die belegten Tage. Über eine zweite kumulierte
+    Summe lässt sich die Verfügbarkeit für jedes Anreisedatum und jede
+    Aufenthaltsdauer ohne weitere Abfragen berechnen. Wie bei der Suche gilt
+    ein Aufenthalt vom Anreise- bis und mit Abreisedatum.
+    '''
+
+    def __init__(self, first_day: date, last_day: date, room_ids, hotel_ids, max_guests):
+        self.first_day = first_day
+        self.days = (last_day - first_day).days + 1
+        self.room_ids = np.asarray(room_ids, dtype=np.int64)
+        self.hotel_ids = np.asarray(hotel_ids, dtype=np.int64)
+        self.max_guests = np.asarray(max_guests, dtype=np.int32)
+        self._room_order = np.argsort(self.room_ids, kind="stable")
+        # +1 per booking on its first day and -1 after its last day, inside the window
+        self._changes = np.zeros((len(self.room_ids), self.days + 1), dtype=np.int32)
+        self._booked_before = None
+
+    @classmethod
+    def load(cls, session: Session, rooms_query: Select, first_day: date, last_day: date):
+        # rooms_query selects Room.id, Room.hotel_id, Room.number and Room.max_guests
+        first_day, last_day = as_date(first_day), as_date(last_day)
+        rooms = rooms_query.subquery()
+        query_rooms = select(rooms.c.id, rooms.c.hotel_id, rooms.c.max_guests).order_by(rooms.c.hotel_id, rooms.c.id)
+        room_rows = session.execute(query_rooms).all()
+        matrix = cls(first_day, last_day, [row[0] for row in room_rows], [row[1] for row in room_rows],
+                     [row[2] for row in room_rows])
+
+        # day offsets are computed by SQLite, no date objects are built for the bookings
+        first_julian_day = func.julianday(first_day.isoformat())
+        query_bookings = select(
+            rooms.c.id,
+            cast(func.julianday(Booking.start_date) - first_julian_day, Integer),
+            cast(func.julianday(Booking.end_date) - first_julian_day, Integer)
+        ).join(Booking, and_(Booking.room_hotel_id == rooms.c.hotel_id, Booking.room_number == rooms.c.number)).where(
+            Booking.start_date <= last_day,
+            Booking.end_date >= first_day
+        )
+        rows = session.execute(query_bookings).all()
+        bookings = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=3 * len(rows)).reshape(-1, 3)
+        matrix.add_bookings(bookings[:, 0], bookings[:, 1], bookings[:, 2])
+        return matrix
+
+    def add_bookings(self, room_ids, start_offsets, end_offsets):
+        rows = np.searchsorted(self.room_ids, room_ids, sorter=self._room_order)
+        rows = self._room_order[rows]
+        np.add.at(self._changes, (rows, np.clip(start_offsets, 0, self.days)), 1)
+        np.add.at(self._changes, (rows, np.clip(end_offsets + 1, 0, self.days)), -1)
+        self._booked_before = None
+
+    def occupied(self) -> np.ndarray:
+        # rooms × days, True where the room is booked
+        return np.cumsum(self._changes[:, :self.days], axis=1) > 0
+
+    def free_rooms(self, nights: int) -> np.ndarray:
+        # rooms × start days, True where the room is free from the start day through start day + nights
+        if self._booked_before is None:
+            self._booked_before = np.zeros((len(self.room_ids), self.days + 1), dtype=np.int32)
+            np.cumsum(self.occupied(), axis=1, out=self._booked_before[:, 1:])
+        length = nights + 1
+        if length > self.days:
+            return np.zeros((len(self.room_ids), 0), dtype=bool)
+        return self._booked_before[:, length:] - self._booked_before[:, :self.days - length + 1] == 0
+
+    def available_room_counts(self, nights: int, guests: int = 1):
+        # (hotel ids, hotels × start days) with the number of free rooms for the given guests
+        fitting = self.free_rooms(nights) & (self.max_guests >= guests)[:, None]
+        hotel_ids, first_rows = np.unique(self.hotel_ids, return_index=True)
+        if not len(hotel_ids):
+            return hotel_ids, np.zeros((0, fitting.shape[1]), dtype=np.int32)
+        return hotel_ids, np.add.reduceat(fitting.astype(np.int32), first_rows, axis=0)
+
+    def available_start_dates(self, nights: int, guests: int = 1) -> dict:
+        # hotel_id -> start dates with at least one free room
+        hotel_ids, counts = self.available_room_counts(nights, guests)
+        result = {}
+        for hotel_id, row in zip(hotel_ids.tolist(), counts):
+            offsets = np.flatnonzero(row)
+            if len(offsets):
+                result[hotel_id] = [self.first_day + timedelta(days=offset) for offset in offsets.tolist()]
+        return result
@@ -1,19 +1,15 @@
-import os
-from pathlib import Path
-
-from sqlalchemy import create_engine, Select
+from sqlalchemy import Select
 from sqlalchemy.orm import Session
-from sqlalchemy.orm import scoped_session, sessionmaker
-
-from data_access.data_base import init_db
 
 
 class BaseManager(object):
-    def __init__(self, session):
+    def __init__(self, session, read_session=None):
         self._session: Session = session
+        # reads go to a separate read-only session if one is given
+        self._read_session: Session = read_session if read_session is not None else session
 
     def select_all(self, query: Select):
-        return self._session.execute(query).scalars().all()
+        return self._read_session.execute(query).scalars().all()
 
     def select_one(self, query: Select):
-        return self._session.execute(query).scalars().one()
\ No newline at end of file
+        return self._read_session.execute(query).scalars().one()
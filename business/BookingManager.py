@@ -1,10 +1,19 @@
-from pathlib import Path
+import csv
+import gzip
+import json
+import random
+import time
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, select, and_
-from sqlalchemy.orm import scoped_session, sessionmaker
-from data_access.data_base import init_db
+from pathlib import Path
+from sqlalchemy import select, insert, delete, and_, literal, type_coerce, Integer, String, Date
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload
+from data_access.data_base import init_db, room_night_rows
+from data_access.engine_factory import get_db_file, create_sessions
 from data_models.models import *
-from business.SearchManager import SearchManager
+from business.AvailabilityIndex import AvailabilityIndex, RoomOccupancy, as_date
+from business.SearchCache import SearchCache
+from business.SearchManager import SearchManager, overlapping_bookings
 from business.BaseManager import BaseManager
 from business.UserManager import UserManager
 
@@ -15,15 +24,65 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class BookingManager(BaseManager):
-    def __init__(self, session):
-        super().__init__(session)
+# every hop is many-to-one, so the whole graph comes with the bookings in a single joined query
+BOOKING_LOAD_OPTIONS = (
+    joinedload(Booking.room).joinedload(Room.hotel).joinedload(Hotel.address),
+    joinedload(Booking.guest).joinedload(Guest.address),
+)
+
+
+def booking_details_query(raw_dates: bool = False):
+    # flat rows for reports, no ORM objects are built; raw_dates keeps the ISO strings stored by SQLite
+    start_date, end_date = Booking.start_date, Booking.end_date
+    if raw_dates:
+        start_date = type_coerce(start_date, String).label("start_date")
+        end_date = type_coerce(end_date, String).label("end_date")
+    return select(
+        Booking.id,
+        start_date,
+        end_date,
+        Booking.number_of_guests,
+        Booking.comment,
+        Hotel.id.label("hotel_id"),
+        Hotel.name.label("hotel_name"),
+        Address.city,
+        Room.number.label("room_number"),
+        Room.type.label("room_type"),
+        Room.price,
+        Guest.id.label("guest_id"),
+        Guest.firstname,
+        Guest.lastname,
+        Guest.email
+    ).join(
+        Room, (Room.hotel_id == Booking.room_hotel_id) & (Room.number == Booking.room_number)
+    ).join(
+        Hotel, Hotel.id == Room.hotel_id
+    ).join(
+        Address, Address.id == Hotel.address_id
+    ).join(
+        Guest, Guest.id == Booking.guest_id
+    )
+
 
-    def get_bookings_of(self, guest_id: int):
+class BookingManager(BaseManager):
+    _MAX_RETRIES = 8
+    _RETRY_BACKOFF = 0.01
+
+    def __init__(self, session, availability_index: AvailabilityIndex = None, search_cache: SearchCache = None,
+                 read_session=None):
+        super().__init__(session, read_session)
+        self._availability_index = availability_index
+        self._search_cache = search_cache
+
+    def _select_bookings(self, projection: bool, *criteria):
+        if projection:
+            return self._read_session.execute(booking_details_query().where(*criteria).order_by(Booking.id)).all()
+        query = select(Booking).options(*BOOKING_LOAD_OPTIONS).where(*criteria)
+        return self._read_session.execute(query).scalars().all()
+
+    def get_bookings_of(self, guest_id: int, projection: bool = False):
         try:
-            query_booking = select(Booking).where(Booking.guest_id == guest_id)
-            bookings = self._session.execute(query_booking).scalars().all()
-            return bookings
+            return self._select_bookings(projection, Booking.guest_id == guest_id)
         except Exception as e:
             logger.error(f"Error retrieving bookings: {e}")
             return []
@@ -31,23 +90,205 @@ class BookingManager(BaseManager):
     def create_booking(self, room_hotel_id: int, room_number: str, guest_id: int, number_of_guests: int,
                        start_date: datetime, end_date: datetime, comment: str):
         try:
-            booking = Booking(
-                room_hotel_id=room_hotel_id,
-                room_number=room_number,
-                guest_id=guest_id,
-                number_of_guests=number_of_guests,
-                start_date=start_date,
-                end_date=end_date,
-                comment=comment
-            )
-            self._session.add(booking)
-            self._session.commit()
-            logger.info("Booking successfully created")
+            booking_id = self.reserve_room(room_hotel_id, room_number, guest_id, number_of_guests,
+                                           start_date, end_date, comment)
+            if booking_id is None:
+                logger.info("Booking not created, the room is not available")
+            else:
+                logger.info("Booking successfully created")
+            return booking_id
         except Exception as e:
             logger.error(f"Error creating booking: {e}")
+            return None
+
+    def reserve_room(self, room_hotel_id: int, room_number: str, guest_id: int, number_of_guests: int,
+                     start_date: datetime, end_date: datetime, comment: str = None):
+        '''
+        Books the room only if it is still free: the availability check and the insert run as one
+        conditional INSERT inside a BEGIN IMMEDIATE transaction, so concurrent writers cannot
+        double-book. Returns the new booking id, or None if the room is taken or does not exist.
+        Raises ValueError if the end date is before the start date.
+        '''
+        start_date, end_date = as_date(start_date), as_date(end_date)
+        if start_date > end_date:
+            raise ValueError("End date before start date")
+        query_conflict = select(Booking.id).where(
+            Booking.room_hotel_id == room_hotel_id,
+            Booking.room_number == room_number,
+            overlapping_bookings(start_date, end_date)
+        )
+        query_values = select(
+            literal(room_hotel_id, Integer),
+            literal(room_number, String),
+            literal(guest_id, Integer),
+            literal(number_of_guests, Integer),
+            literal(start_date, Date),
+            literal(end_date, Date),
+            literal(comment, String)
+        ).where(
+            select(Room.id).where(Room.hotel_id == room_hotel_id, Room.number == room_number).exists(),
+            ~query_conflict.exists()
+        )
+        query_insert = insert(Booking).from_select(
+            ['room_hotel_id', 'room_number', 'guest_id', 'number_of_guests', 'start_date', 'end_date', 'comment'],
+            query_values
+        ).returning(Booking.id)
+
+        def insert_booking(connection):
+            booking_id = connection.execute(query_insert).scalar_one_or_none()
+            if booking_id is not None:
+                connection.execute(insert(RoomNight), room_night_rows(booking_id, room_hotel_id, room_number,
+                                                                      start_date, end_date))
+            return booking_id
+
+        booking_id = self._write_immediate(insert_booking)
+        if booking_id is not None:
+            if self._availability_index is not None:
+                self._availability_index.add_booking(booking_id, room_hotel_id, room_number, start_date, end_date)
+            if self._search_cache is not None:
+                self._search_cache.invalidate(room_hotel_id, start_date, end_date)
+        return booking_id
+
+    def _write_immediate(self, work):
+        # runs work(connection) on a dedicated connection inside BEGIN IMMEDIATE: the write lock is taken
+        # before the first read, so no other writer (thread or process) can commit between check and insert.
+        # The whole work is repeated if the lock cannot be taken.
+        attempt = 0
+        while True:
+            try:
+                with self._session.get_bind().connect() as connection:
+                    connection.exec_driver_sql("BEGIN IMMEDIATE")
+                    result = work(connection)
+                    connection.commit()
+                return result
+            except OperationalError as e:
+                if "locked" not in str(e) or attempt >= self._MAX_RETRIES:
+                    raise
+                # exponential backoff with jitter so waiting writers do not retry in lockstep
+                time.sleep(self._RETRY_BACKOFF * 2 ** attempt * (1 + random.random()))
+                attempt += 1
+
+    def create_bookings_bulk(self, bookings: list, chunk_size: int = 500, dry_run: bool = False) -> list:
+        '''
+        Creates many bookings in one transaction. Each booking is a dict with the arguments of
+        create_booking. Bookings overlapping an existing booking or an earlier booking of the
+        same batch are rejected. Check and insert run under one BEGIN IMMEDIATE like
+        reserve_room, so concurrent reservations cannot slip in between. Returns one result
+        dict per booking, in input order. With dry_run the bookings are only checked on the
+        session (uncommitted rows of the caller included), accepted bookings have no booking_id.
+        '''
+        fields = ('room_hotel_id', 'room_number', 'guest_id', 'number_of_guests', 'start_date', 'end_date')
+        results = [{'index': i, 'accepted': False, 'booking_id': None, 'reason': None} for i in range(len(bookings))]
+        rows = []
+        for i, booking in enumerate(bookings):
+            missing = [field for field in fields if booking.get(field) is None]
+            if missing:
+                results[i]['reason'] = f"Missing fields: {', '.join(missing)}"
+            elif as_date(booking['start_date']) > as_date(booking['end_date']):
+                results[i]['reason'] = "End date before start date"
+            else:
+                rows.append((i, {
+                    'room_hotel_id': booking['room_hotel_id'],
+                    'room_number': booking['room_number'],
+                    'guest_id': booking['guest_id'],
+                    'number_of_guests': booking['number_of_guests'],
+                    'start_date': as_date(booking['start_date']),
+                    'end_date': as_date(booking['end_date']),
+                    'comment': booking.get('comment')
+                }))
+        if not rows:
+            return results
+
+        first_day = min(row['start_date'] for i, row in rows)
+        last_day = max(row['end_date'] for i, row in rows)
+
+        def check_and_insert(connection):
+            accepted, rejected = self._check_bookings(connection, rows, first_day, last_day, chunk_size)
+            booking_ids = []
+            if accepted:
+                query_insert = insert(Booking).returning(Booking.id, sort_by_parameter_order=True)
+                booking_ids = connection.execute(query_insert, [row for i, row in accepted]).scalars().all()
+                nights = []
+                for (i, row), booking_id in zip(accepted, booking_ids):
+                    nights.extend(room_night_rows(booking_id, row['room_hotel_id'], row['room_number'],
+                                                  row['start_date'], row['end_date']))
+                connection.execute(insert(RoomNight), nights)
+            return accepted, rejected, booking_ids
+
+        try:
+            if dry_run:
+                accepted, rejected = self._check_bookings(self._session.connection(), rows, first_day, last_day,
+                                                          chunk_size)
+            else:
+                accepted, rejected, booking_ids = self._write_immediate(check_and_insert)
+            for i, reason in rejected.items():
+                results[i]['reason'] = reason
+
+            if dry_run:
+                for i, row in accepted:
+                    results[i]['accepted'] = True
+            elif accepted:
+                for (i, row), booking_id in zip(accepted, booking_ids):
+                    results[i]['accepted'] = True
+                    results[i]['booking_id'] = booking_id
+                    if self._availability_index is not None:
+                        self._availability_index.add_booking(booking_id, row['room_hotel_id'], row['room_number'],
+                                                             row['start_date'], row['end_date'])
+                if self._search_cache is not None:
+                    for hotel_id in {row['room_hotel_id'] for i, row in accepted}:
+                        self._search_cache.invalidate(hotel_id, first_day, last_day)
+            logger.info(f"Bulk booking: {len(accepted)} of {len(bookings)} bookings "
+                        f"{'valid' if dry_run else 'created'}")
+        except Exception as e:
+            # _write_immediate rolls back its own connection; the session belongs to the caller, a dry run
+            # only read from it
+            logger.error(f"Error creating bookings: {e}")
+            for result in results:
+                if result['accepted'] or result['reason'] is None:
+                    result.update(accepted=False, booking_id=None, reason=f"Error creating booking: {e}")
+        return results
+
+    @staticmethod
+    def _check_bookings(connection, rows, first_day, last_day, chunk_size: int):
+        # (accepted rows, index -> reason) against the bookings visible to the connection and earlier rows
+        hotel_ids = list({row['room_hotel_id'] for i, row in rows})
+
+        # one set-based lookup per chunk of hotels for rooms and overlapping bookings
+        rooms = set()
+        occupancy = {}
+        for n in range(0, len(hotel_ids), chunk_size):
+            chunk = hotel_ids[n:n + chunk_size]
+            rooms.update(connection.execute(
+                select(Room.hotel_id, Room.number).where(Room.hotel_id.in_(chunk))
+            ).all())
+            query_existing = select(
+                Booking.id, Booking.room_hotel_id, Booking.room_number, Booking.start_date, Booking.end_date
+            ).where(Booking.room_hotel_id.in_(chunk), overlapping_bookings(first_day, last_day))
+            for booking_id, hotel_id, number, start_date, end_date in connection.execute(query_existing):
+                occupancy.setdefault((hotel_id, number), RoomOccupancy()).add(booking_id, start_date, end_date)
+
+        accepted = []
+        rejected = {}
+        for i, row in rows:
+            key = (row['room_hotel_id'], row['room_number'])
+            room_occupancy = occupancy.setdefault(key, RoomOccupancy())
+            if key not in rooms:
+                rejected[i] = "Room does not exist"
+            elif not room_occupancy.is_free(row['start_date'], row['end_date']):
+                rejected[i] = "Room is already booked"
+            else:
+                room_occupancy.add(-i - 1, row['start_date'], row['end_date'])
+                accepted.append((i, row))
+        return accepted, rejected
 
     def get_available_rooms(self, hotel: Hotel, start_date: datetime, end_date: datetime, number_of_guests: int):
         try:
+            if self._availability_index is not None:
+                room_ids = self._availability_index.get_available_room_ids(
+                    self._read_session, [hotel.id], start_date, end_date, number_of_guests
+                )
+                return self._read_session.execute(select(Room).where(Room.id.in_(room_ids))).scalars().all()
+
             q_booked_rooms = select(Room).join(Booking).where(
                 and_(
                     Booking.start_date <= end_date,
@@ -60,28 +301,24 @@ class BookingManager(BaseManager):
                     Room.max_guests >= number_of_guests
                 )
             )
-            booked_rooms = self._session.execute(q_booked_rooms).scalars().all()
-            all_rooms = self._session.execute(q_all_rooms).scalars().all()
+            booked_rooms = self._read_session.execute(q_booked_rooms).scalars().all()
+            all_rooms = self._read_session.execute(q_all_rooms).scalars().all()
             available = [room for room in all_rooms if room not in booked_rooms]
             return available
         except Exception as e:
             logger.error(f"Error retrieving available rooms: {e}")
             return []
 
-    def get_all_bookings(self):
+    def get_all_bookings(self, projection: bool = False):
         try:
-            bookings_query = select(Booking)
-            bookings = self._session.execute(bookings_query).scalars().all()
-            return bookings
+            return self._select_bookings(projection)
         except Exception as e:
             logger.error(f"Error retrieving all bookings: {e}")
             return []
 
-    def get_bookings_by_hotel(self, hotel_id: int):
+    def get_bookings_by_hotel(self, hotel_id: int, projection: bool = False):
         try:
-            bookings_query = select(Booking).join(Room).where(Room.hotel_id == hotel_id)
-            bookings = self._session.execute(bookings_query).scalars().all()
-            return bookings
+            return self._select_bookings(projection, Booking.room_hotel_id == hotel_id)
         except Exception as e:
             logger.error(f"Error retrieving bookings for the hotel: {e}")
             return []
@@ -89,7 +326,7 @@ class BookingManager(BaseManager):
     def get_guest(self, id: int):
         try:
             guest_query = select(Guest).where(Guest.id == id)
-            guest = self._session.execute(guest_query).scalars().one()
+            guest = self._read_session.execute(guest_query).scalars().one()
             return guest
         except Exception as e:
             logger.error(f"Error retrieving guest: {e}")
@@ -122,19 +359,42 @@ class BookingManager(BaseManager):
         try:
             booking_query = select(Booking).where(Booking.id == reservation_id)
             booking = self._session.execute(booking_query).scalars().one()
+            previous = (booking.room_hotel_id, booking.start_date, booking.end_date)
             for key, value in kwargs.items():
                 setattr(booking, key, value)
+            if as_date(booking.start_date) > as_date(booking.end_date):
+                raise ValueError("End date before start date")
+            # the room nights change in the same transaction as the booking
+            self._session.execute(delete(RoomNight).where(RoomNight.booking_id == booking.id))
+            self._session.execute(insert(RoomNight), room_night_rows(
+                booking.id, booking.room_hotel_id, booking.room_number,
+                as_date(booking.start_date), as_date(booking.end_date)
+            ))
             self._session.commit()
+            if self._availability_index is not None:
+                self._availability_index.update_booking(booking.id, booking.room_hotel_id, booking.room_number,
+                                                        booking.start_date, booking.end_date)
+            if self._search_cache is not None:
+                self._search_cache.invalidate(*previous)
+                self._search_cache.invalidate(booking.room_hotel_id, booking.start_date, booking.end_date)
         except Exception as e:
+            self._session.rollback()
             logger.error(f"Error updating booking: {e}")
 
     def delete_booking(self, reservation_id: int):
         try:
             booking_query = select(Booking).where(Booking.id == reservation_id)
             booking = self._session.execute(booking_query).scalars().one()
+            previous = (booking.room_hotel_id, booking.start_date, booking.end_date)
+            self._session.execute(delete(RoomNight).where(RoomNight.booking_id == reservation_id))
             self._session.delete(booking)
             self._session.commit()
+            if self._availability_index is not None:
+                self._availability_index.remove_booking(reservation_id)
+            if self._search_cache is not None:
+                self._search_cache.invalidate(*previous)
         except Exception as e:
+            self._session.rollback()
             logger.error(f"Error deleting booking: {e}")
 
     def update_room_availability(self, room_hotel_id: int, room_number: str, availability: bool):
@@ -156,9 +416,57 @@ class BookingManager(BaseManager):
             room = self._session.execute(room_query).scalars().one()
             room.price = price
             self._session.commit()
+            if self._search_cache is not None:
+                self._search_cache.invalidate(room_hotel_id)
         except Exception as e:
             logger.error(f"Error updating room price: {e}")
 
+    def export_bookings(self, file_name: str, file_format: str = None, hotel_id: int = None, guest_id: int = None,
+                        start_date: datetime = None, end_date: datetime = None, compress: bool = None,
+                        chunk_size: int = 10_000) -> int:
+        # format and compression follow the file name unless given, e.g. "bookings.jsonl.gz"
+        suffixes = [suffix.lower() for suffix in Path(file_name).suffixes]
+        if compress is None:
+            compress = ".gz" in suffixes
+        if file_format is None:
+            file_format = "jsonl" if ".jsonl" in suffixes else "csv"
+        if file_format not in ("csv", "jsonl"):
+            raise ValueError(f"Unsupported export format: {file_format}")
+
+        criteria = []
+        if hotel_id is not None:
+            criteria.append(Booking.room_hotel_id == hotel_id)
+        if guest_id is not None:
+            criteria.append(Booking.guest_id == guest_id)
+        if start_date is not None and end_date is not None:
+            criteria.append(overlapping_bookings(as_date(start_date), as_date(end_date)))
+        query = booking_details_query(raw_dates=True).where(*criteria).order_by(Booking.id) \
+            .execution_options(yield_per=chunk_size)
+
+        # rows are fetched and written one chunk at a time, memory does not grow with the number of bookings;
+        # the plain connection skips the ORM result processing
+        rows_written = 0
+        result = self._read_session.connection().execute(query)
+        if compress:
+            file = gzip.open(file_name, "wt", encoding="utf-8", newline="", compresslevel=1)
+        else:
+            file = open(file_name, "w", encoding="utf-8", newline="", buffering=1024 * 1024)
+        with file, result:
+            columns = list(result.keys())
+            if file_format == "csv":
+                writer = csv.writer(file)
+                writer.writerow(columns)
+                for rows in result.partitions():
+                    writer.writerows(rows)
+                    rows_written += len(rows)
+            else:
+                encoder = json.JSONEncoder(ensure_ascii=False)
+                for rows in result.partitions():
+                    file.writelines(encoder.encode(dict(zip(columns, row))) + "\n" for row in rows)
+                    rows_written += len(rows)
+        logger.info(f"{rows_written} bookings exported to {file_name}")
+        return rows_written
+
     def download_booking_details(self, booking: Booking):
         try:
             file_name = f"booking_details_{booking.id}.txt"
@@ -217,9 +525,12 @@ def handle_guest_session(bm, sm, user, date_format):
 
                     in_comment = input("Booking comment: ")
 
-                    bm.create_booking(selected_room.hotel_id, selected_room.number, user.id, in_number_of_guests,
-                                      in_start_date, in_end_date, in_comment)
-                    print("Booking successful!")
+                    booking_id = bm.create_booking(selected_room.hotel_id, selected_room.number, user.id,
+                                                   in_number_of_guests, in_start_date, in_end_date, in_comment)
+                    if booking_id:
+                        print("Booking successful!")
+                    else:
+                        print("The room has just been booked by someone else, please choose another one.")
                 else:
                     print("No rooms available!")
             else:
@@ -236,7 +547,9 @@ def handle_admin_session(um, hm, bm):
     while True:
         print("\nAdmin Menu:")
         print("1. Display all hotels")
-        print("2. Logout")
+        print("2. Export bookings of a hotel")
+        print("3. Show the occupancy calendar of a hotel")
+        print("4. Logout")
         admin_choice = input("Choose an option: ")
 
         if admin_choice == '1':
@@ -259,6 +572,19 @@ def handle_admin_session(um, hm, bm):
             else:
                 print("No hotels available.")
         elif admin_choice == '2':
+            all_hotels = hm.get_all_hotels()
+            display_hotels(all_hotels)
+            hotel_selection = int(input("Choose a hotel to export its bookings: "))
+            selected_hotel = all_hotels[hotel_selection - 1]
+            file_name = input("File name (.csv, .jsonl, optionally .gz): ")
+            exported = bm.export_bookings(file_name, hotel_id=selected_hotel.id)
+            print(f"{exported} bookings exported to {file_name}.")
+        elif admin_choice == '3':
+            all_hotels = hm.get_all_hotels()
+            display_hotels(all_hotels)
+            hotel_selection = int(input("Choose a hotel to see its occupancy: "))
+            hm.occupancy_calendar_console(all_hotels[hotel_selection - 1].id)
+        elif admin_choice == '4':
             um.logout()
             break
         else:
@@ -334,15 +660,15 @@ def handle_registered_user_session(um, bm, sm, user, date_format):
             print("Invalid choice. Please try again.")
 
 if __name__ == '__main__':
-    db_file = '../data/database.db'
-    db_path = Path(db_file)
-    if not db_path.is_file():
-        init_db(db_file, generate_example_data=True)
-
-    engine = create_engine(f'sqlite:///{db_file}')
-    session = scoped_session(sessionmaker(bind=engine))
-    sm = SearchManager(session)
-    bm = BookingManager(session)
+    db_file = get_db_file()
+    # creates missing tables and indexes, example data is only added to empty tables
+    init_db(db_file, generate_example_data=True, migrate=True)
+
+    session, read_session = create_sessions(db_file)
+    availability_index = AvailabilityIndex(db_file)
+    search_cache = SearchCache()
+    sm = SearchManager(session, availability_index, search_cache, read_session, use_room_nights=True)
+    bm = BookingManager(session, availability_index, search_cache, read_session)
     um = UserManager(session)
     #hm = HotelManager(session)
 
@@ -351,7 +677,7 @@ if __name__ == '__main__':
 
     # Import HotelManager only when needed to avoid circular import issue
     from business.HotelManager import HotelManager
-    hm = HotelManager(session)
+    hm = HotelManager(session, availability_index, search_cache, read_session)
 
     print("Welcome to Team C's Hotel Booking System!")
     while True:
@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class CredentialCache(object):
+    '''
+    Begrenzter LRU Cache mit Ablaufzeit für erfolgreich geprüfte Logins. Statt
+    des Passworts wird nur ein HMAC mit einem zufälligen Schlüssel dieses
+    Prozesses gespeichert, zusammen mit dem gespeicherten Passwort-Hash. Ändert
+    sich der Hash in der Datenbank, passt der Eintrag nicht mehr und das
+    Passwort wird wieder mit scrypt geprüft.
+    '''
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 900.0):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._key = os.urandom(32)
+        # username -> (stored hash, HMAC of the password, expires at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _digest(self, password: str) -> bytes:
+        return hmac.new(self._key, password.encode("utf-8"), hashlib.sha256).digest()
+
+    def verify(self, username: str, stored_hash: str, password: str) -> bool:
+        # True if this password was verified against this hash before; False means "unknown", not "wrong"
+        digest = self._digest(password)
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[2] < time.monotonic() or entry[0] != stored_hash:
+                if entry is not None:
+                    del self._entries[username]
+                self.misses += 1
+                return False
+            if not hmac.compare_digest(entry[1], digest):
+                self.misses += 1
+                return False
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return True
+
+    def put(self, username: str, stored_hash: str, password: str):
+        digest = self._digest(password)
+        with self._lock:
+            self._entries[username] = (stored_hash, digest, time.monotonic() + self._ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str = None):
+        with self._lock:
+            if username is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(username, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_entries': self._max_entries,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -1,28 +1,38 @@
 import sys
-from pathlib import Path
-from datetime import datetime
-from sqlalchemy import create_engine, select, update, delete, insert
-from sqlalchemy.orm import scoped_session, sessionmaker, joinedload
-from sqlalchemy.orm.scoping import scoped_session
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, insert, func, case
+from sqlalchemy.orm import joinedload
+from data_access.amenities import fill_room_amenities, set_room_amenities
 from data_access.data_base import init_db
+from data_access.data_importer import read_rows, import_hotels, parse_booking_row, write_error_report
+from data_access.engine_factory import get_db_file, create_sessions
 from data_models.models import *
 
-from data_access.data_generator import *
-
+from business.AvailabilityIndex import AvailabilityIndex, as_date
+from business.OccupancyCalendar import OccupancyCalendar
+from business.SearchCache import SearchCache
 from business.SearchManager import SearchManager
 from business.BaseManager import BaseManager
 from business.UserManager import UserManager
 from business.BookingManager import BookingManager
 
 class HotelManager(BaseManager):
-    def __init__(self, session):
-        super().__init__(session)
+    def __init__(self, session, availability_index: AvailabilityIndex = None, search_cache: SearchCache = None,
+                 read_session=None):
+        super().__init__(session, read_session)
+        self._availability_index = availability_index
+        self._search_cache = search_cache
 
     def add_hotel(self, name: str, stars: int, address: Address, rooms):
         if len(rooms) > 0:
             hotel = Hotel(name=name, stars=stars, address=address, rooms=rooms)
             self._session.add(hotel)
+            # the new rooms get the highest ids, their amenity rows are written in the same transaction
+            self._session.flush()
+            fill_room_amenities(self._session.connection(), min(room.id for room in rooms))
             self._session.commit()
+            # a new hotel can show up in any cached search of its city
+            self._hotels_changed()
         else:
             raise AttributeError('Hotel with no rooms are not allowed')
 
@@ -30,33 +40,142 @@ class HotelManager(BaseManager):
         hotel_query = delete(Hotel).where(Hotel.id == hotel_id)
         self._session.execute(hotel_query)
         self._session.commit()
+        self._hotels_changed(hotel_id, rooms_changed=True)
 
     def get_all_hotels(self):
-        query = select(Hotel)
-        return self._session.execute(query).scalars().all()
+        query = select(Hotel).options(joinedload(Hotel.address))
+        return self._read_session.execute(query).scalars().all()
 
     def update_hotel(self, hotel_id: int, name: str = None, stars: int = None):
         query = update(Hotel).where(Hotel.id == hotel_id).values(name=name, stars=stars)
         self._session.execute(query)
         self._session.commit()
+        # changed stars can move the hotel into other star filters
+        self._hotels_changed(hotel_id if stars is None else None)
 
     def update_address(self, address_id: int, street: str, city: str, zip_code: int):
         query = update(Address).where(Address.id == address_id).values(street=street, city=city, zip=zip_code)
         self._session.execute(query)
         self._session.commit()
+        self._hotels_changed()
 
     def update_room(self, room_id: int, room_number: int, type: str, max_guests: int, description: str, amenities: str,
                     price: float):
         query = update(Room).where(Room.id == room_id).values(number=room_number, type=type, max_guests=max_guests,
                                                               description=description, amenities=amenities, price=price)
         self._session.execute(query)
+        set_room_amenities(self._session.connection(), room_id, amenities)
         self._session.commit()
-        pass
+        hotel_id = self._session.execute(select(Room.hotel_id).where(Room.id == room_id)).scalars().one_or_none()
+        self._hotels_changed(hotel_id, rooms_changed=True)
+
+    def import_hotels(self, hotels_file: str, bookings_file: str = None, dry_run: bool = False,
+                      error_file: str = None, chunk_size: int = 10_000) -> dict:
+        # hotels, addresses and rooms are imported in one transaction; a dry run validates and rolls back
+        errors = []
+        try:
+            report = import_hotels(self._session.connection(), read_rows(hotels_file), chunk_size, errors)
+        except Exception:
+            self._session.rollback()
+            raise
+        for error in errors:
+            error["file"] = hotels_file
+        if not dry_run:
+            self._session.commit()
+            self._hotels_changed(rooms_changed=True)
+
+        report["bookings"] = 0
+        if bookings_file:
+            booking_errors = []
+            chunk = []
+            for line, row in read_rows(bookings_file):
+                try:
+                    chunk.append((line, parse_booking_row(row, report["hotel_ids"])))
+                except ValueError as e:
+                    booking_errors.append(dict(line=line, error=str(e)))
+                if len(chunk) >= chunk_size:
+                    report["bookings"] += self._import_bookings(chunk, dry_run, booking_errors)
+                    chunk = []
+            if chunk:
+                report["bookings"] += self._import_bookings(chunk, dry_run, booking_errors)
+            for error in booking_errors:
+                error["file"] = bookings_file
+            errors.extend(sorted(booking_errors, key=lambda error: error["line"]))
+
+        if dry_run:
+            self._session.rollback()
+        if error_file:
+            write_error_report(errors, error_file)
+        report["dry_run"] = dry_run
+        return report
+
+    def _import_bookings(self, chunk: list, dry_run: bool, errors: list) -> int:
+        # overlaps and missing rooms are checked by the bulk booking; a dry run only sees overlaps within a chunk
+        bm = BookingManager(self._session, self._availability_index, self._search_cache, self._read_session)
+        results = bm.create_bookings_bulk([booking for line, booking in chunk], dry_run=dry_run)
+        for (line, booking), result in zip(chunk, results):
+            if not result['accepted']:
+                errors.append(dict(line=line, error=result['reason']))
+        return sum(1 for result in results if result['accepted'])
+
+    def get_occupancy_stats(self, start_date: datetime, end_date: datetime, hotel_id: int = None) -> list:
+        # aggregates over room_night, the end date counts as a booked night like in the availability search;
+        # it is not billed though, revenue adds up to price * nights (total_price of the SearchManager)
+        start_date, end_date = as_date(start_date), as_date(end_date)
+        if end_date < start_date:
+            raise ValueError("End date before start date")
+        days = (end_date - start_date).days + 1
+        query_rooms = select(Room.hotel_id, func.count().label("rooms"))
+        query_nights = select(
+            RoomNight.room_hotel_id.label("hotel_id"),
+            func.count().label("booked_nights"),
+            func.sum(case((RoomNight.night < Booking.end_date, Room.price), else_=0)).label("revenue")
+        ).join(
+            Room, (Room.hotel_id == RoomNight.room_hotel_id) & (Room.number == RoomNight.room_number)
+        ).join(
+            Booking, Booking.id == RoomNight.booking_id
+        ).where(
+            RoomNight.night.between(start_date, end_date)
+        )
+        if hotel_id is not None:
+            # filtered inside the aggregates, so only the nights of this hotel are read
+            query_rooms = query_rooms.where(Room.hotel_id == hotel_id)
+            query_nights = query_nights.where(RoomNight.room_hotel_id == hotel_id)
+        query_rooms = query_rooms.group_by(Room.hotel_id).subquery()
+        query_nights = query_nights.group_by(RoomNight.room_hotel_id).subquery()
+        query = select(
+            Hotel.id, Hotel.name, query_rooms.c.rooms,
+            func.coalesce(query_nights.c.booked_nights, 0).label("booked_nights"),
+            func.coalesce(query_nights.c.revenue, 0.0).label("revenue")
+        ).join(
+            query_rooms, query_rooms.c.hotel_id == Hotel.id
+        ).outerjoin(
+            query_nights, query_nights.c.hotel_id == Hotel.id
+        ).order_by(Hotel.id)
+
+        return [{
+            'hotel_id': row.id,
+            'name': row.name,
+            'rooms': row.rooms,
+            'booked_nights': row.booked_nights,
+            'available_nights': row.rooms * days,
+            'occupancy': row.booked_nights / (row.rooms * days),
+            'revenue': row.revenue
+        } for row in self._read_session.execute(query)]
+
+    def get_occupancy_calendar(self, hotel_id: int, start_date: datetime, end_date: datetime) -> OccupancyCalendar:
+        return OccupancyCalendar.load(self._read_session, hotel_id, start_date, end_date)
+
+    def _hotels_changed(self, hotel_id: int = None, rooms_changed: bool = False):
+        if rooms_changed and self._availability_index is not None:
+            self._availability_index.invalidate(hotel_id)
+        if self._search_cache is not None:
+            self._search_cache.invalidate(hotel_id)
 
     def get_rooms_by_hotel_id(self, hotel_id: int):
         # add join?
         query = select(Room).join(Room.hotel).where(Hotel.id == hotel_id)
-        return self._session.execute(query).scalars().all()
+        return self._read_session.execute(query).scalars().all()
 
     def add_hotel_console(self):
 
@@ -180,6 +299,40 @@ class HotelManager(BaseManager):
 
 
 
+    def import_hotels_console(self):
+        hotels_file = input("Hotels and rooms file (.csv or .jsonl, optionally .gz): ")
+        bookings_file = input("Bookings file (leave empty to skip): ") or None
+        dry_run = input("Only validate the files (Y/N)? ") in ("y", "Y")
+        report = self.import_hotels(hotels_file, bookings_file, dry_run=dry_run)
+        print(f"{'Valid' if dry_run else 'Imported'}: {report['hotels']} hotels, {report['rooms']} rooms, "
+              f"{report['bookings']} bookings")
+        for error in report["errors"]:
+            print(f"{error['file']}:{error['line']}: {error['error']}")
+
+    def occupancy_stats_console(self):
+        try:
+            start_date = datetime.strptime(input("Start date (DD.MM.YYYY): "), "%d.%m.%Y").date()
+            end_date = datetime.strptime(input("End date (DD.MM.YYYY): "), "%d.%m.%Y").date()
+            all_stats = self.get_occupancy_stats(start_date, end_date)
+        except ValueError as e:
+            print(f"Invalid input: {e}")
+            return
+        for stats in all_stats:
+            print(f"{stats['name']}: {stats['booked_nights']} of {stats['available_nights']} nights booked "
+                  f"({stats['occupancy']:.0%}), revenue {stats['revenue']:.2f}")
+
+    def occupancy_calendar_console(self, hotel_id: int = None):
+        if hotel_id is None:
+            hotel_id = int(input("Hotel id: "))
+        month = datetime.strptime(input("Month (MM.YYYY): "), "%m.%Y").date()
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        calendar = self.get_occupancy_calendar(hotel_id, month, next_month - timedelta(days=1))
+        if not len(calendar):
+            print("The hotel has no rooms.")
+            return
+        print(calendar.format_grid())
+        print("# booked, . free")
+
     def remove_hotel_console(self):
         print("All Hotels:")
         hotels = hm.get_all_hotels()
@@ -198,22 +351,19 @@ class HotelManager(BaseManager):
 
 
 if __name__ == '__main__':
-    db_file = '../data/database.db'
-    db_path = Path(db_file)
-    # Ensure the environment Variable is set
-    if not db_path.is_file():
-        init_db(db_file, generate_example_data=True)
-
-    # create the engine and the session.
-    # the engine is private, no need for subclasses to be able to access it.
-    engine = create_engine(f'sqlite:///{db_file}')
-    # create the session as db connection
+    db_file = get_db_file()
+    # creates missing tables and indexes, example data is only added to empty tables
+    init_db(db_file, generate_example_data=True, migrate=True)
+
+    # create the session as db connection, the engine factory keeps the engine private
     # subclasses need access therefore, protected attribute so every inheriting manager has access to the connection
-    session = scoped_session(sessionmaker(bind=engine))
+    session, read_session = create_sessions(db_file)
 
-    hm = HotelManager(session)
-    sm = SearchManager(session)
-    bm = BookingManager(session)
+    availability_index = AvailabilityIndex(db_file)
+    search_cache = SearchCache()
+    hm = HotelManager(session, availability_index, search_cache, read_session)
+    sm = SearchManager(session, availability_index, search_cache, read_session, use_room_nights=True)
+    bm = BookingManager(session, availability_index, search_cache, read_session)
     um = UserManager(session)
 
     # login user -> only admins can access this part
@@ -228,6 +378,9 @@ if __name__ == '__main__':
             print("3.) Update Hotel / Address / Room information")
             print("4.) Get all bookings")
             print("5.) Show all hotels")
+            print("6.) Import hotels from file")
+            print("7.) Occupancy and revenue statistics")
+            print("8.) Occupancy calendar of a hotel")
             user_selection = input("Please choose an option: ")
 
             match user_selection:
@@ -248,6 +401,12 @@ if __name__ == '__main__':
                     all_hotels = hm.get_all_hotels()
                     for hotels in all_hotels:
                         print(f"Hotel: {hotels}")
+                case "6":
+                    hm.import_hotels_console()
+                case "7":
+                    hm.occupancy_stats_console()
+                case "8":
+                    hm.occupancy_calendar_console()
 
             user_logout_input = input("Do you want to logout?`(Y/N)")
             if user_logout_input == "y" or user_logout_input == "Y":
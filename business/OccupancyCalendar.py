@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+
+from sqlalchemy import select, and_, cast, func, Integer
+from sqlalchemy.orm import Session
+
+from business.AvailabilityIndex import as_date
+from data_models.models import Room, Booking
+
+
+class OccupancyCalendar(object):
+    '''
+    Belegungskalender eines Hotels für ein Datumsfenster: pro Zimmer ein
+    Bitset (Python int), Bit d ist gesetzt, wenn das Zimmer am Tag
+    first_day + d belegt ist. Wird mit einer einzigen Abfrage über room und
+    booking geladen, Abfragen pro Tag oder pro Zimmer entfallen.
+    '''
+
+    def __init__(self, hotel_id: int, first_day: date, last_day: date):
+        self.hotel_id = hotel_id
+        self.first_day = first_day
+        self.days = (last_day - first_day).days + 1
+        self.room_numbers = []
+        self._bits = {}
+
+    @classmethod
+    def load(cls, session: Session, hotel_id: int, first_day: date, last_day: date):
+        first_day, last_day = as_date(first_day), as_date(last_day)
+        calendar = cls(hotel_id, first_day, last_day)
+        # rooms without bookings in the window come with NULL offsets
+        first_julian_day = func.julianday(first_day.isoformat())
+        query = select(
+            Room.number,
+            cast(func.julianday(Booking.start_date) - first_julian_day, Integer),
+            cast(func.julianday(Booking.end_date) - first_julian_day, Integer)
+        ).outerjoin(Booking, and_(
+            Booking.room_hotel_id == Room.hotel_id,
+            Booking.room_number == Room.number,
+            Booking.start_date <= last_day,
+            Booking.end_date >= first_day
+        )).where(Room.hotel_id == hotel_id).order_by(Room.number)
+        for room_number, start, end in session.execute(query):
+            calendar.add_booking(room_number, start, end)
+        return calendar
+
+    def add_booking(self, room_number: str, start: int = None, end: int = None):
+        # start and end are day offsets from first_day, the end day is booked too
+        if room_number not in self._bits:
+            self.room_numbers.append(room_number)
+            self._bits[room_number] = 0
+        if start is None:
+            return
+        start, end = max(start, 0), min(end, self.days - 1)
+        if start <= end:
+            self._bits[room_number] |= ((1 << (end - start + 1)) - 1) << start
+
+    def __len__(self):
+        return len(self.room_numbers)
+
+    def day(self, offset: int) -> date:
+        return self.first_day + timedelta(days=offset)
+
+    def bits(self, room_number: str) -> int:
+        return self._bits[room_number]
+
+    def is_booked(self, room_number: str, day: date) -> bool:
+        offset = (as_date(day) - self.first_day).days
+        return 0 <= offset < self.days and bool(self._bits[room_number] >> offset & 1)
+
+    def booked_days(self, room_number: str) -> int:
+        return self._bits[room_number].bit_count()
+
+    def free_room_numbers(self, day: date) -> list:
+        return [number for number in self.room_numbers if not self.is_booked(number, day)]
+
+    def booked_rooms_per_day(self) -> list:
+        return [sum(bits >> offset & 1 for bits in self._bits.values()) for offset in range(self.days)]
+
+    def format_grid(self, booked: str = "#", free: str = ".") -> str:
+        # one line per room, one column per day, the header shows the day of the month
+        width = max([len("Room")] + [len(number) for number in self.room_numbers])
+        lines = [
+            " " * width + " " + "".join(str(self.day(offset).day // 10 or " ") for offset in range(self.days)),
+            "Room".ljust(width) + " " + "".join(str(self.day(offset).day % 10) for offset in range(self.days))
+        ]
+        for number in self.room_numbers:
+            bits = self._bits[number]
+            lines.append(number.ljust(width) + " " +
+                         "".join(booked if bits >> offset & 1 else free for offset in range(self.days)))
+        return "\n".join(lines)
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import date
+
+from business.AvailabilityIndex import as_date
+
+
+class CacheEntry(object):
+    def __init__(self, value, expires_at: float, hotel_ids, start_date: date, end_date: date):
+        self.value = value
+        self.expires_at = expires_at
+        # hotels that could appear in the result, None if every hotel could
+        self.hotel_ids = hotel_ids
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def is_affected_by(self, hotel_id: int = None, start_date: date = None, end_date: date = None) -> bool:
+        if hotel_id is not None and self.hotel_ids is not None and hotel_id not in self.hotel_ids:
+            return False
+        if start_date is not None and end_date is not None:
+            return self.start_date <= end_date and self.end_date >= start_date
+        return True
+
+
+class SearchCache(object):
+    '''
+    LRU Cache mit Ablaufzeit für Suchresultate des SearchManagers. Jeder Eintrag
+    merkt sich, welche Hotels und welcher Zeitraum das Resultat beeinflussen,
+    damit Buchungsänderungen nur die betroffenen Einträge verwerfen. Die Werte
+    werden von allen Threads geteilt und müssen deshalb unveränderlich sein
+    (Ids, Tupel), keine ORM-Objekte einer Session. Ein Resultat wird mit der
+    Generation gespeichert, die vor der Berechnung gelesen wurde; lief seither
+    eine Invalidierung, die es betrifft, wird es verworfen statt gespeichert.
+    '''
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        # incremented by every invalidation, the recent ones are kept to check results computed meanwhile
+        self._generation = 0
+        self._invalidations = deque(maxlen=256)
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry.value
+
+    @property
+    def generation(self) -> int:
+        # read before a result is computed and passed to put
+        with self._lock:
+            return self._generation
+
+    def _invalidated_since(self, generation: int, entry: CacheEntry) -> bool:
+        if generation >= self._generation:
+            return False
+        if not self._invalidations or self._invalidations[0][0] > generation + 1:
+            # older invalidations than the log holds ran meanwhile
+            return True
+        return any(entry.is_affected_by(*invalidation[1:])
+                   for invalidation in self._invalidations if invalidation[0] > generation)
+
+    def put(self, key, value, hotel_ids, start_date: date, end_date: date, generation: int = None):
+        with self._lock:
+            hotel_ids = set(hotel_ids) if hotel_ids is not None else None
+            entry = CacheEntry(value, time.monotonic() + self._ttl, hotel_ids, as_date(start_date), as_date(end_date))
+            if generation is not None and self._invalidated_since(generation, entry):
+                self.rejected += 1
+                return False
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, hotel_id: int = None, start_date: date = None, end_date: date = None):
+        start_date, end_date = as_date(start_date), as_date(end_date)
+        with self._lock:
+            self._generation += 1
+            self._invalidations.append((self._generation, hotel_id, start_date, end_date))
+            affected = [
+                key for key, entry in self._entries.items()
+                if entry.is_affected_by(hotel_id, start_date, end_date)
+            ]
+            for key in affected:
+                del self._entries[key]
+            return len(affected)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._invalidations.append((self._generation, None, None, None))
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'rejected': self.rejected,
+                'size': len(self._entries),
+                'max_entries': self._max_entries,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -1,68 +1,291 @@
 from datetime import date, datetime, timedelta
-from pathlib import Path
 
-from sqlalchemy import create_engine, select, or_, and_
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy import select, and_, false, Select
 
+from data_access.amenities import room_has_amenities, amenity_key
 from data_access.data_base import init_db
+from data_access.engine_factory import get_db_file, create_sessions
+from data_access.hotel_fts import hotel_fts, hotel_fts_matches, match_expression, match_hotel_ids
+from business.AvailabilityIndex import AvailabilityIndex, as_date
+from business.SearchCache import SearchCache
 from business.BaseManager import BaseManager
-from data_models.models import Hotel, Room, Booking, Address
+from data_models.models import Hotel, Room, Booking, Address, RoomNight
+
+
+# ids per IN list when cached results are loaded again
+ID_CHUNK_SIZE = 10_000
+
+
+def overlapping_bookings(start_date: date, end_date: date):
+    return and_(Booking.start_date <= end_date, Booking.end_date >= start_date)
+
+
+def booked_room_exists(start_date: date, end_date: date):
+    # correlated with the enclosing Room, answered by ix_booking_room_dates
+    return select(Booking.id).where(
+        Booking.room_hotel_id == Room.hotel_id,
+        Booking.room_number == Room.number,
+        overlapping_bookings(start_date, end_date)
+    ).exists()
+
+
+def booked_night_exists(start_date: date, end_date: date):
+    # anti-join on the materialized nights, answered by the primary key (room_hotel_id, room_number, night)
+    return select(RoomNight.night).where(
+        RoomNight.room_hotel_id == Room.hotel_id,
+        RoomNight.room_number == Room.number,
+        RoomNight.night.between(start_date, end_date)
+    ).exists()
+
+
+def fitting_room(guests: int, amenities=None):
+    # condition on Room: enough beds and every requested amenity, e.g. "TV, Minibar"
+    has_amenities = room_has_amenities(amenities)
+    if has_amenities is None:
+        return Room.max_guests >= guests
+    return and_(Room.max_guests >= guests, has_amenities)
 
 
 class SearchManager(BaseManager):
-    def __init__(self, session):
-        super().__init__(session)
+    def __init__(self, session, availability_index: AvailabilityIndex = None, search_cache: SearchCache = None,
+                 read_session=None, use_room_nights: bool = False):
+        super().__init__(session, read_session)
+        self._availability_index = availability_index
+        self._search_cache = search_cache
+        self._booked_room_exists = booked_night_exists if use_room_nights else booked_room_exists
+
+    def search_hotels(self, search: str, limit: int = 20):
+        # ranked prefix search over hotel name, city, street and the room descriptions, see data_access.hotel_fts
+        expression = match_expression(search)
+        if expression is None:
+            return []
+        # FTS5 answers ORDER BY rank LIMIT n with a top-n sort, every match is ranked but only n are kept;
+        # see "SearchManager.search_hotels[common word]" in benchmark.run for the cost of a word in every hotel
+        candidates = select(hotel_fts.c.rowid.label("hotel_id"), hotel_fts.c.rank).where(
+            hotel_fts_matches(expression)
+        ).order_by(hotel_fts.c.rank).limit(limit).subquery()
+        query = select(Hotel).join(candidates, candidates.c.hotel_id == Hotel.id) \
+            .order_by(candidates.c.rank).limit(limit)
+        return self._read_session.execute(query).scalars().all()
 
     def get_all_cities_with_hotels(self):
         query = select(Address.city).join(Hotel)
-        return self._session.execute(query).scalars().all()
+        return self._read_session.execute(query).scalars().all()
+
+    def get_available_rooms(self, hotel_id, start_date: date, end_date: date, guests: int, amenities=None):
+        key = ('rooms', hotel_id, as_date(start_date), as_date(end_date), guests, amenity_key(amenities))
+        return self._cached(key, start_date, end_date, lambda: [hotel_id],
+                            lambda: self._find_available_rooms(hotel_id, start_date, end_date, guests, amenities),
+                            self._freeze_ids, lambda room_ids: self._load_by_ids(Room, room_ids))
+
+    def _find_available_rooms(self, hotel_id, start_date: date, end_date: date, guests: int, amenities=None):
+        if self._availability_index is not None:
+            room_ids = self._availability_index.get_available_room_ids(
+                self._read_session, [hotel_id], start_date, end_date, guests
+            )
+            query = select(Room).where(Room.id.in_(room_ids), fitting_room(guests, amenities))
+            return self._read_session.execute(query).scalars().all()
 
-    def get_available_rooms(self, hotel_id, start_date: date, end_date: date, guests: int):
-        query_booked_rooms = select(Room.id).join(Booking).where(
-            Room.hotel_id == hotel_id,
-            or_(Booking.start_date.between(start_date, end_date), Booking.end_date.between(start_date, end_date))
-        )
         query = select(Room).where(
             Room.hotel_id == hotel_id,
-            Room.id.not_in(query_booked_rooms),
-            Room.max_guests >= guests
+            fitting_room(guests, amenities),
+            ~self._booked_room_exists(as_date(start_date), as_date(end_date))
         )
-        result = self._session.execute(query).scalars().all()
+        result = self._read_session.execute(query).scalars().all()
 
         return result
 
     def get_available_hotels_by_city_stars_and_guests(self, start_date: date, end_date: date, guests: int,
-                                                      city: str = None, stars: int = None, stars_is_max=True):
-        query_booked_rooms = select(Room.id).join(Booking).where(
-            or_(Booking.start_date.between(start_date, end_date), Booking.end_date.between(start_date, end_date))
+                                                      city: str = None, stars: int = None, stars_is_max=True,
+                                                      amenities=None):
+        key = ('hotels', as_date(start_date), as_date(end_date), guests, city, stars, stars_is_max,
+               amenity_key(amenities))
+        return self._cached(
+            key, start_date, end_date,
+            lambda: self._get_candidate_hotel_ids(city, stars, stars_is_max),
+            lambda: self._find_available_hotels(start_date, end_date, guests, city, stars, stars_is_max, amenities),
+            self._freeze_ids, lambda hotel_ids: self._load_by_ids(Hotel, hotel_ids)
         )
 
-        query_available_rooms = select(Room).join(Hotel).where(
-            Room.id.not_in(query_booked_rooms),
-            Room.max_guests >= guests
+    def _find_available_hotels(self, start_date: date, end_date: date, guests: int,
+                               city: str = None, stars: int = None, stars_is_max=True, amenities=None):
+        # the index only knows beds and bookings, searches for amenities go to the database
+        if self._availability_index is not None and not amenity_key(amenities):
+            return self._get_available_hotels_from_index(start_date, end_date, guests, city, stars, stars_is_max)
+
+        query_available_rooms = select(Room.hotel_id).where(
+            fitting_room(guests, amenities),
+            ~self._booked_room_exists(as_date(start_date), as_date(end_date))
+        )
+        query = self._filter_hotels(
+            select(Hotel).where(Hotel.id.in_(query_available_rooms)), city, stars, stars_is_max
+        )
+        return self._read_session.execute(query).scalars().all()
+
+    def search_hotels_with_available_rooms(self, start_date: date, end_date: date, guests: int,
+                                           city: str = None, stars: int = None, stars_is_max=True, amenities=None):
+        key = ('hotels_with_rooms', as_date(start_date), as_date(end_date), guests, city, stars, stars_is_max,
+               amenity_key(amenities))
+        return self._cached(
+            key, start_date, end_date,
+            lambda: self._get_candidate_hotel_ids(city, stars, stars_is_max),
+            lambda: self._find_hotels_with_available_rooms(start_date, end_date, guests, city, stars, stars_is_max,
+                                                           amenities),
+            self._freeze_hotels_with_rooms, self._thaw_hotels_with_rooms
         )
 
+    def _find_hotels_with_available_rooms(self, start_date: date, end_date: date, guests: int,
+                                          city: str = None, stars: int = None, stars_is_max=True,
+                                          amenities=None):
+        stay_duration = (end_date - start_date).days
+        query = select(
+            Hotel.id.label("hotel_id"),
+            Hotel.name.label("hotel_name"),
+            Hotel.stars,
+            Address.city,
+            Room.id.label("room_id"),
+            Room.number,
+            Room.type,
+            Room.max_guests,
+            Room.description,
+            Room.amenities,
+            Room.price.label("price_per_night"),
+            (Room.price * stay_duration).label("total_price")
+        ).join(Hotel, Room.hotel_id == Hotel.id).where(
+            fitting_room(guests, amenities)
+        ).order_by(Hotel.id, Room.number)
+        query = self._filter_hotels(query, city, stars, stars_is_max)
+
+        if self._availability_index is not None:
+            # the bookings are checked in memory, the query only filters beds, amenities, city and stars
+            rows = self._read_session.execute(query).all()
+            available_ids = set(self._availability_index.get_available_room_ids(
+                self._read_session, list(dict.fromkeys(row.hotel_id for row in rows)), start_date, end_date, guests
+            ))
+            rows = [row for row in rows if row.room_id in available_ids]
+        else:
+            query = query.where(~self._booked_room_exists(as_date(start_date), as_date(end_date)))
+            rows = self._read_session.execute(query)
+
+        hotels = {}
+        for row in rows:
+            hotel = hotels.get(row.hotel_id)
+            if hotel is None:
+                hotel = {
+                    'id': row.hotel_id,
+                    'name': row.hotel_name,
+                    'stars': row.stars,
+                    'city': row.city,
+                    'rooms': []
+                }
+                hotels[row.hotel_id] = hotel
+            hotel['rooms'].append(row)
+
+        return list(hotels.values())
+
+    def search_flexible_dates(self, first_start_date: date, last_start_date: date, nights: int, guests: int,
+                              city: str = None, stars: int = None, stars_is_max=True, amenities=None):
+        # every start date in [first_start_date, last_start_date] is answered from one occupancy matrix,
+        # instead of one search per date
+        from business.AvailabilityMatrix import AvailabilityMatrix
+
+        first_start_date, last_start_date = as_date(first_start_date), as_date(last_start_date)
+        query_hotels = self._filter_hotels(select(Hotel.id, Hotel.name, Hotel.stars, Address.city),
+                                           city, stars, stars_is_max)
+        query_rooms = select(Room.id, Room.hotel_id, Room.number, Room.max_guests).where(
+            fitting_room(guests, amenities),
+            Room.hotel_id.in_(query_hotels.with_only_columns(Hotel.id))
+        )
+        matrix = AvailabilityMatrix.load(self._read_session, query_rooms, first_start_date,
+                                         last_start_date + timedelta(days=nights))
+        start_dates = matrix.available_start_dates(nights, guests)
+        if not start_dates:
+            return []
+
+        query_hotels = query_hotels.where(Hotel.id.in_(start_dates.keys())).order_by(Hotel.id)
+        return [
+            {
+                'id': row.id,
+                'name': row.name,
+                'stars': row.stars,
+                'city': row.city,
+                'start_dates': start_dates[row.id]
+            }
+            for row in self._read_session.execute(query_hotels)
+        ]
+
+    def _get_available_hotels_from_index(self, start_date: date, end_date: date, guests: int,
+                                         city: str = None, stars: int = None, stars_is_max=True):
+        query_hotels = self._filter_hotels(select(Hotel), city, stars, stars_is_max)
+        hotels = self._read_session.execute(query_hotels).scalars().all()
+        available_ids = self._availability_index.get_available_hotel_ids(
+            self._read_session, [hotel.id for hotel in hotels], start_date, end_date, guests
+        )
+        return [hotel for hotel in hotels if hotel.id in available_ids]
+
+    def _get_candidate_hotel_ids(self, city: str = None, stars: int = None, stars_is_max=True):
+        if not city and not stars:
+            return None
+        query = self._filter_hotels(select(Hotel.id), city, stars, stars_is_max)
+        return self._read_session.execute(query).scalars().all()
+
+    def _cached(self, key, start_date: date, end_date: date, get_hotel_ids, compute, freeze, thaw):
+        # the cache holds immutable plain values (ids, tuples) shared by all threads; every hit builds its own
+        # ORM objects in the caller's read session, or its own dicts, so callers cannot change the cached value
+        if self._search_cache is None:
+            return compute()
+        found, value = self._search_cache.get(key)
+        if found:
+            return thaw(value)
+        # a booking committed while computing invalidates after the result was read, put then rejects it
+        generation = self._search_cache.generation
+        result = compute()
+        self._search_cache.put(key, freeze(result), get_hotel_ids(), start_date, end_date, generation)
+        return result
+
+    @staticmethod
+    def _freeze_ids(objects) -> tuple:
+        return tuple(obj.id for obj in objects)
+
+    def _load_by_ids(self, model, ids) -> list:
+        # primary key lookups in chunks below the SQLite variable limit, in the order of ids
+        by_id = {}
+        for i in range(0, len(ids), ID_CHUNK_SIZE):
+            query = select(model).where(model.id.in_(ids[i:i + ID_CHUNK_SIZE]))
+            by_id.update((obj.id, obj) for obj in self._read_session.execute(query).scalars())
+        return [by_id[obj_id] for obj_id in ids if obj_id in by_id]
+
+    @staticmethod
+    def _freeze_hotels_with_rooms(hotels) -> tuple:
+        # result rows are immutable tuples already
+        return tuple((hotel['id'], hotel['name'], hotel['stars'], hotel['city'], tuple(hotel['rooms']))
+                     for hotel in hotels)
+
+    @staticmethod
+    def _thaw_hotels_with_rooms(hotels) -> list:
+        return [
+            {'id': hotel_id, 'name': name, 'stars': stars, 'city': city, 'rooms': list(rooms)}
+            for hotel_id, name, stars, city, rooms in hotels
+        ]
+
+    @staticmethod
+    def _filter_hotels(query: Select, city: str = None, stars: int = None, stars_is_max=True) -> Select:
+        query = query.join(Address, Hotel.address_id == Address.id)
+        # every word of the city is matched as a prefix in the full-text index, e.g. "st gal" finds "St. Gallen"
         if city:
-            query_available_rooms = query_available_rooms.join(Address).where(
-                Address.city.like(f"%{city}%")
-            )
+            city_hotel_ids = match_hotel_ids(city, ["city"])
+            # a city without any word ("!!") matches no hotel, it does not drop the filter
+            query = query.where(Hotel.id.in_(city_hotel_ids) if city_hotel_ids is not None else false())
         if stars:
             if stars_is_max:
-                query_available_rooms = query_available_rooms.where(Hotel.stars <= stars)
+                query = query.where(Hotel.stars <= stars)
             else:
-                query_available_rooms = query_available_rooms.where(Hotel.stars >= stars)
-
-        result = self._session.execute(query_available_rooms).scalars().all()
-        hotels = []
-        for room in result:
-            if room.hotel not in hotels:
-                hotels.append(room.hotel)
-
-        return hotels
+                query = query.where(Hotel.stars >= stars)
+        return query
 
     def get_room_details(self, hotel: Hotel, stay_duration: int):
         query_rooms = select(Room).where(Room.hotel_id == hotel.id)
-        rooms = self._session.execute(query_rooms).scalars().all()
+        rooms = self._read_session.execute(query_rooms).scalars().all()
 
         room_details = []
         for room in rooms:
@@ -98,15 +321,14 @@ def get_date_input(prompt):
 
 
 if __name__ == "__main__":
-    db_file = '../data/database.db'
-    db_path = Path(db_file)
-    if not db_path.is_file():
-        init_db(db_file, generate_example_data=True)
+    db_file = get_db_file()
+    # creates missing tables and indexes, example data is only added to empty tables
+    init_db(db_file, generate_example_data=True, migrate=True)
 
-    engine = create_engine(f'sqlite:///{db_file}')
-    session = scoped_session(sessionmaker(bind=engine))
+    session, read_session = create_sessions(db_file)
 
-    sm = SearchManager(session)
+    # all bookings are written by the BookingManager, which keeps the room nights up to date
+    sm = SearchManager(session, read_session=read_session, use_room_nights=True)
 
     cities_with_hotels = sm.get_all_cities_with_hotels()
 
@@ -144,13 +366,16 @@ if __name__ == "__main__":
             nr_guests = input("For how many guests are you looking for: ").strip()
         nr_guests = int(nr_guests)
 
-        available_hotels = sm.get_available_hotels_by_city_stars_and_guests(
+        amenities = input("Required room amenities, comma separated (optional): ").strip()
+
+        available_hotels = sm.search_hotels_with_available_rooms(
             start_date,
             end_date,
             nr_guests,
             city,
             user_stars,
-            user_stars_is_max
+            user_stars_is_max,
+            amenities
         )
 
         if not available_hotels:
@@ -158,15 +383,14 @@ if __name__ == "__main__":
                 f"No hotels available in {city} with {user_stars} star(s) for {nr_guests} guest(s) and the given dates.")
         else:
             for hotel in available_hotels:
-                print(f"Hotel: {hotel.name}")
+                print(f"Hotel: {hotel['name']}")
                 print("-" * 20)
-                available_rooms = sm.get_available_rooms(hotel.id, start_date, end_date, nr_guests)
-                for room in available_rooms:
+                for room in hotel['rooms']:
                     print(f"Room Type: {room.type}")
                     print(f"Room Number: {room.number}")
                     print(f"Room max guests: {room.max_guests}")
-                    print(f"Room costs per night: {room.price}")
-                    print(f"Room total costs: {room.price * stay_duration}")
+                    print(f"Room costs per night: {room.price_per_night}")
+                    print(f"Room total costs: {room.total_price}")
                     print(f"Room amenities: {room.amenities}")
                     print()
                     print()
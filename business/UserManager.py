@@ -1,11 +1,12 @@
 import os
 import sys
-from pathlib import Path
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy import select
 from data_access.data_base import init_db
+from data_access.engine_factory import get_db_file, create_session
+from data_access.passwords import hash_password, verify_password, verify_unknown_user, needs_rehash
 from data_models.models import *
 from business.BaseManager import BaseManager
+from business.CredentialCache import CredentialCache
 
 # Function to display the welcome message
 def show_welcome():
@@ -50,11 +51,13 @@ def navigate_menu(um):
 
 # Definition of the UserManager class
 class UserManager(BaseManager):
-    def __init__(self, session):
+    def __init__(self, session, credential_cache: CredentialCache = None):
         super().__init__(session)
         self._current_user = None
         self._MAX_ATTEMPTS = 3
         self._attempts_left = self._MAX_ATTEMPTS
+        # repeated logins of a user skip the key derivation
+        self._credential_cache = credential_cache
 
     def get_current_user(self):
         return self._current_user
@@ -63,12 +66,30 @@ class UserManager(BaseManager):
         if self._attempts_left <= 0:
             raise RuntimeError('No attempts left')
         else:
-            query = select(Login).where(Login.username == username, Login.password == password)
-            result = self._session.execute(query).scalars().one_or_none()
-            self._current_user = result
+            query = select(Login).where(Login.username == username)
+            login = self._session.execute(query).scalars().one_or_none()
+            if login is None:
+                verify_unknown_user(password)
+            elif not self._check_password(login, password):
+                login = None
+            self._current_user = login
             self._attempts_left -= 1
         return self._current_user
 
+    def _check_password(self, login: Login, password: str) -> bool:
+        if self._credential_cache is not None and self._credential_cache.verify(login.username, login.password,
+                                                                                password):
+            return True
+        if not verify_password(password, login.password):
+            return False
+        # plaintext rows and hashes with outdated parameters are replaced on the first successful login
+        if needs_rehash(login.password):
+            login.password = hash_password(password)
+            self._session.commit()
+        if self._credential_cache is not None:
+            self._credential_cache.put(login.username, login.password, password)
+        return True
+
     def logout(self):
         self._current_user = None
         self._attempts_left = self._MAX_ATTEMPTS
@@ -138,7 +159,7 @@ class UserManager(BaseManager):
                 lastname=lastname,
                 email=email,
                 address_id=address.id,
-                login=Login(username=username, password=password, role_id=role.id)
+                login=Login(username=username, password=hash_password(password), role_id=role.id)
             )
             self._session.add(guest)
             self._session.commit()
@@ -150,15 +171,11 @@ class UserManager(BaseManager):
             return None
 
 if __name__ == '__main__':
-    os.environ["DB_FILE"] = "../data/database.db"
-    db_file = os.environ["DB_FILE"]
-    db_path = Path(db_file)
-    if not db_path.is_file():
-        init_db(db_file, generate_example_data=True)
-
-    engine = create_engine(f"sqlite:///{db_file}")
-    Session = scoped_session(sessionmaker(bind=engine))
-    session = Session()
+    db_file = get_db_file()
+    # creates missing tables and indexes, example data is only added to empty tables
+    init_db(db_file, generate_example_data=True, migrate=True)
+
+    session = create_session(db_file)
 
     um = UserManager(session)
 
@@ -0,0 +1,113 @@
+import re
+import string
+
+from sqlalchemy import Connection, Engine, select, insert, delete, and_
+
+from data_models.models import Amenity, Room, RoomAmenity
+
+_SEPARATOR = re.compile(r"[,;]")
+# amenity.name uses the NOCASE collation, which only folds ASCII letters; "Ü" and "ü" are different amenities
+_NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _fold_name(name: str) -> str:
+    # the comparison key SQLite uses for amenity.name
+    return name.translate(_NOCASE)
+
+
+def parse_amenities(amenities) -> list:
+    # "TV, Caffe Machine" or ["TV", "caffe  machine"] -> ["TV", "Caffe Machine"];
+    # whitespace is collapsed, duplicates are dropped like the NOCASE collation compares them, the order is kept
+    if amenities is None:
+        return []
+    if isinstance(amenities, str):
+        amenities = [amenities]
+    names = {}
+    for text in amenities:
+        for part in _SEPARATOR.split(text or ""):
+            name = " ".join(part.split())
+            if name:
+                names.setdefault(_fold_name(name), name)
+    return list(names.values())
+
+
+def _amenity_ids(connection: Connection, names: list, known: dict) -> list:
+    # known maps folded names to ids and is extended with the amenities created here
+    missing = [name for name in names if _fold_name(name) not in known]
+    if missing:
+        connection.execute(insert(Amenity), [dict(name=name) for name in missing])
+        for amenity_id, name in connection.execute(select(Amenity.id, Amenity.name).where(Amenity.name.in_(missing))):
+            known[_fold_name(name)] = amenity_id
+    return [known[_fold_name(name)] for name in names]
+
+
+def _known_amenities(connection: Connection) -> dict:
+    # a few dozen rows, loaded once per fill
+    return {_fold_name(name): amenity_id for amenity_id, name in connection.execute(select(Amenity.id, Amenity.name))}
+
+
+def fill_room_amenities(connection: Connection, first_room_id: int = 1, chunk_size: int = 10_000) -> int:
+    # (re)writes the amenity rows of the rooms from first_room_id on, parsed from room.amenities
+    connection.execute(delete(RoomAmenity).where(RoomAmenity.room_id >= first_room_id))
+    known = _known_amenities(connection)
+    # bulk data repeats the same few strings, each one is parsed once
+    parsed = {}
+    rows = []
+    count = 0
+    query = select(Room.id, Room.amenities).where(Room.id >= first_room_id, Room.amenities.is_not(None)) \
+        .execution_options(yield_per=chunk_size)
+    for room_id, amenities in connection.execute(query):
+        amenity_ids = parsed.get(amenities)
+        if amenity_ids is None:
+            amenity_ids = parsed[amenities] = _amenity_ids(connection, parse_amenities(amenities), known)
+        rows.extend(dict(room_id=room_id, amenity_id=amenity_id) for amenity_id in amenity_ids)
+        if len(rows) >= chunk_size:
+            connection.execute(insert(RoomAmenity), rows)
+            count += len(rows)
+            rows = []
+    if rows:
+        connection.execute(insert(RoomAmenity), rows)
+        count += len(rows)
+    return count
+
+
+def rebuild_room_amenities(engine: Engine) -> int:
+    with engine.begin() as connection:
+        return fill_room_amenities(connection)
+
+
+def set_room_amenities(connection: Connection, room_id: int, amenities: str) -> int:
+    # for a single changed room; plain SQL, the statements differ by the number of amenities and the ORM
+    # constructs cost more than the three writes. Missing amenities are added through the unique name, whose
+    # NOCASE comparison is the folding parse_amenities applies.
+    connection.exec_driver_sql("DELETE FROM room_amenity WHERE room_id = ?", (room_id,))
+    names = parse_amenities(amenities)
+    if not names:
+        return 0
+    marks = ", ".join("?" for _ in names)
+    connection.exec_driver_sql(f"INSERT OR IGNORE INTO amenity (name) VALUES {', '.join('(?)' for _ in names)}",
+                               tuple(names))
+    return connection.exec_driver_sql(
+        f"INSERT INTO room_amenity (room_id, amenity_id) SELECT ?, id FROM amenity WHERE name IN ({marks})",
+        (room_id, *names)
+    ).rowcount
+
+
+def room_has_amenities(amenities):
+    # condition on the enclosing Room: one EXISTS per required amenity, each answered by the primary key
+    # (room_id, amenity_id); the amenity id is looked up once through the unique name index
+    names = parse_amenities(amenities)
+    if not names:
+        return None
+    return and_(*(
+        select(RoomAmenity.room_id).where(
+            RoomAmenity.room_id == Room.id,
+            RoomAmenity.amenity_id == select(Amenity.id).where(Amenity.name == name).scalar_subquery()
+        ).exists()
+        for name in names
+    ))
+
+
+def amenity_key(amenities) -> tuple:
+    # normalized amenities for cache keys, independent of order and of case as far as NOCASE ignores it
+    return tuple(sorted(_fold_name(name) for name in parse_amenities(amenities)))
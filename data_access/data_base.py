@@ -1,35 +1,185 @@
+import argparse
 import os
+from datetime import date, timedelta
 from pathlib import Path
 
-from sqlalchemy import create_engine
-from sqlalchemy.schema import CreateTable
+from sqlalchemy import Engine, Connection, select, delete, inspect, text
+from sqlalchemy.schema import CreateTable, CreateIndex
 
+from data_access.engine_factory import create_db_engine, get_db_file
+from data_access.amenities import fill_room_amenities, rebuild_room_amenities
+from data_access.passwords import hash_plaintext_passwords
+from data_access.hotel_fts import create_hotel_fts, drop_hotel_fts, fill_hotel_fts, rebuild_hotel_fts
 from data_models.models import *
-from data_access.data_generator import *
 
-def init_db(file_path: str, create_ddl: bool = False, generate_example_data: bool = False, verbose: bool = False):
-    path = Path(file_path)
-    data_folder = path.parent
-    engine = create_engine(f"sqlite:///{file_path}")
 
-    if path.is_file():
-        Base.metadata.drop_all(engine)
-    else:
-        if not data_folder.exists():
-            data_folder.mkdir(parents=True)
+# increase whenever tables or indexes are added or stored values change their format,
+# so existing databases are migrated once at startup
+SCHEMA_VERSION = 5
+
+# expands every booking into its days, start and end date included like in the overlap test of the searches
+QUERY_FILL_ROOM_NIGHTS = text("""
+    INSERT INTO room_night (room_hotel_id, room_number, night, booking_id)
+    WITH RECURSIVE nights (booking_id, room_hotel_id, room_number, night, end_date) AS (
+        SELECT id, room_hotel_id, room_number, start_date, end_date FROM booking WHERE id >= :first_booking_id
+        UNION ALL
+        SELECT booking_id, room_hotel_id, room_number, date(night, '+1 day'), end_date
+        FROM nights WHERE night < end_date
+    )
+    SELECT room_hotel_id, room_number, night, booking_id FROM nights
+""")
 
+
+def get_schema_version(engine: Engine) -> int:
+    with engine.connect() as connection:
+        return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate_db(engine: Engine, verbose: bool = False) -> bool:
+    # a database at the current version is not inspected at all, this keeps startup fast on large files
+    if get_schema_version(engine) == SCHEMA_VERSION:
+        return False
+
+    # create tables that do not exist yet, then add indexes missing on existing tables
+    had_room_nights = inspect(engine).has_table(RoomNight.__tablename__)
+    had_hotel_fts = inspect(engine).has_table("hotel_fts")
+    had_room_amenities = inspect(engine).has_table(RoomAmenity.__tablename__)
     Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+                if verbose:
+                    print(f"Index ensured: {index.name}")
+        if not had_room_nights:
+            fill_room_nights(connection)
+        create_hotel_fts(connection)
+        if not had_hotel_fts:
+            fill_hotel_fts(connection)
+        if not had_room_amenities:
+            fill_room_amenities(connection)
+        # logins of databases created before passwords were hashed
+        hash_plaintext_passwords(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    if verbose:
+        print(f"Schema migrated to version {SCHEMA_VERSION}")
+    return True
 
-    if create_ddl:
-        with open(path.with_suffix(".ddl"), "w") as ddl_file:
-            for table in Base.metadata.tables.values():
-                create_table = str(CreateTable(table).compile(engine)).strip()
-                ddl_file.write(f"{create_table};{os.linesep}")
 
-    if generate_example_data:
+def room_night_rows(booking_id: int, room_hotel_id: int, room_number: str, start_date: date, end_date: date) -> list:
+    return [
+        dict(room_hotel_id=room_hotel_id, room_number=room_number, night=start_date + timedelta(days=day),
+             booking_id=booking_id)
+        for day in range((end_date - start_date).days + 1)
+    ]
+
+
+def fill_room_nights(connection: Connection, first_booking_id: int = 1) -> int:
+    return connection.execute(QUERY_FILL_ROOM_NIGHTS, {"first_booking_id": first_booking_id}).rowcount
+
+
+def rebuild_room_nights(engine: Engine) -> int:
+    # derives the whole room_night table from booking again, in one transaction
+    with engine.begin() as connection:
+        connection.execute(delete(RoomNight))
+        return fill_room_nights(connection)
+
+
+def _is_empty(engine: Engine, model) -> bool:
+    with engine.connect() as connection:
+        return connection.execute(select(model.id).limit(1)).first() is None
+
+
+def seed_example_data(engine: Engine, verbose: bool = False):
+    # the generator is only imported when data is generated, it is not needed at startup
+    from data_access.data_generator import generate_system_data, generate_hotels, generate_guests, \
+        generate_registered_guests, generate_random_bookings, generate_random_registered_bookings
+
+    # only empty tables are filled, existing data is never touched
+    if _is_empty(engine, Role):
         generate_system_data(engine, verbose=verbose)
+    if _is_empty(engine, Hotel):
         generate_hotels(engine, verbose=verbose)
+        rebuild_room_amenities(engine)
+    if _is_empty(engine, Guest):
         generate_guests(engine, verbose=verbose)
+    if _is_empty(engine, RegisteredGuest):
         generate_registered_guests(engine, verbose=verbose)
+    if _is_empty(engine, Booking):
         generate_random_bookings(engine, verbose=verbose)
-        generate_random_registered_bookings(engine, verbose=verbose)
\ No newline at end of file
+        generate_random_registered_bookings(engine, verbose=verbose)
+        rebuild_room_nights(engine)
+
+
+def _write_ddl(engine: Engine, path: Path):
+    with open(path.with_suffix(".ddl"), "w") as ddl_file:
+        for table in Base.metadata.tables.values():
+            create_table = str(CreateTable(table).compile(engine)).strip()
+            ddl_file.write(f"{create_table};{os.linesep}")
+            for index in table.indexes:
+                create_index = str(CreateIndex(index).compile(engine)).strip()
+                ddl_file.write(f"{create_index};{os.linesep}")
+
+
+def explain_query_plan(engine: Engine, statement) -> list:
+    with engine.connect() as connection:
+        compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+        return connection.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+
+
+def init_db(file_path: str, create_ddl: bool = False, generate_example_data: bool = False, verbose: bool = False,
+            migrate: bool = False):
+    # migrate=True keeps an existing database and only adds what is missing,
+    # otherwise an existing database is dropped and created again
+    path = Path(file_path)
+    data_folder = path.parent
+    if not data_folder.exists():
+        data_folder.mkdir(parents=True)
+    engine = create_db_engine(file_path)
+
+    if migrate:
+        migrate_db(engine, verbose=verbose)
+        if create_ddl:
+            _write_ddl(engine, path)
+        if generate_example_data:
+            seed_example_data(engine, verbose=verbose)
+        engine.dispose()
+        return
+
+    if path.is_file():
+        with engine.begin() as connection:
+            drop_hotel_fts(connection)
+        Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        create_hotel_fts(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    if create_ddl:
+        _write_ddl(engine, path)
+
+    if generate_example_data:
+        seed_example_data(engine, verbose=verbose)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintains the database schema and derived tables.")
+    parser.add_argument("--db-file", default=get_db_file())
+    parser.add_argument("--rebuild-room-nights", action="store_true",
+                        help="derive the room_night table from the bookings again")
+    parser.add_argument("--rebuild-hotel-fts", action="store_true",
+                        help="write the full-text index of the hotels again")
+    parser.add_argument("--rebuild-room-amenities", action="store_true",
+                        help="parse room.amenities into the amenity tables again")
+    args = parser.parse_args()
+
+    init_db(args.db_file, migrate=True, verbose=True)
+    engine = create_db_engine(args.db_file)
+    if args.rebuild_room_nights:
+        print("Room nights rebuilt:", rebuild_room_nights(engine))
+    if args.rebuild_hotel_fts:
+        print("Hotel full-text index rebuilt:", rebuild_hotel_fts(engine))
+    if args.rebuild_room_amenities:
+        print("Room amenities rebuilt:", rebuild_room_amenities(engine))
+    engine.dispose()
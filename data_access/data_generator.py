@@ -1,11 +1,21 @@
+import argparse
 import datetime
+import os
 import sys
+import tempfile
 from datetime import date
-from random import seed, choices
+from multiprocessing import Pool
+from pathlib import Path
+from random import seed, choices, choice, randrange, sample
 
-from sqlalchemy import Engine, select
+from sqlalchemy import Engine, select, insert, func
 from sqlalchemy.orm import Session
 
+from data_access.amenities import fill_room_amenities
+from data_access.data_base import init_db, fill_room_nights
+from data_access.hotel_fts import create_hotel_fts_triggers, drop_hotel_fts_triggers, fill_hotel_fts
+from data_access.engine_factory import create_db_engine, get_db_file
+from data_access.passwords import hash_password
 from data_models.models import *
 
 
@@ -13,7 +23,7 @@ def generate_system_data(engine: Engine, verbose: bool = False) -> None:
     with Session(engine) as session:
         administrator = Role(name="administrator", access_level=sys.maxsize)
         registered_user = Role(name="registered_user", access_level=1)
-        admin_login = Login(username="admin", password="password", role=administrator)
+        admin_login = Login(username="admin", password=hash_password("password"), role=administrator)
         session.add_all([administrator, registered_user, admin_login])
         session.commit()
         if verbose:
@@ -174,7 +184,7 @@ def generate_registered_guests(engine: Engine, verbose):
                 ),
                 login=Login(
                     username="sabrina.schmidt@bluemail.ch",
-                    password="SuperSecret",
+                    password=hash_password("SuperSecret"),
                     role=session.query(Role).filter(Role.name == "registered_user").one()
                 )
             ),
@@ -189,7 +199,7 @@ def generate_registered_guests(engine: Engine, verbose):
                 ),
                 login=Login(
                     username="laura.jackson@bluemail.ch",
-                    password="SuperSecret",
+                    password=hash_password("SuperSecret"),
                     role=session.query(Role).filter(Role.name == "registered_user").one()
                 )
             )
@@ -291,4 +301,252 @@ def generate_random_registered_bookings(engine: Engine, k: int = 5, s: int = 1,
             print("Registred bookings added:", len(registered_bookings_to_add))
             print("#" * 50)
             for booking in registered_bookings_to_add:
-                print(booking)
\ No newline at end of file
+                print(booking)
+
+
+BULK_CITIES = ["Olten", "Zürich", "Basel", "Bern", "Luzern", "Genf", "Lugano", "St. Gallen", "Aarau", "Chur"]
+BULK_AMENITIES = ["TV", "Caffe Machine", "Minibar", "Balcony", "Bathtub", "Air Conditioning", "Safe", "Lake View"]
+BULK_ROOM_TYPES = [("single room", 1, 110.0), ("double room", 2, 150.0), ("family room", 4, 220.0),
+                   ("suite", 4, 300.0)]
+# first day of the generated bookings, fixed so that a seed always gives the same dates
+BULK_START_DATE = date(2025, 1, 1)
+
+
+def _insert_chunked(connection, table, rows, chunk_size: int) -> int:
+    # executemany per chunk, only one chunk of rows is in memory at a time
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            connection.execute(insert(table), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        connection.execute(insert(table), chunk)
+        count += len(chunk)
+    return count
+
+
+def _bulk_rooms(first_hotel_id: int, hotels: int, rooms_per_hotel: int):
+    for hotel_id in range(first_hotel_id, first_hotel_id + hotels):
+        for n in range(1, rooms_per_hotel + 1):
+            room_type, max_guests, price = choice(BULK_ROOM_TYPES)
+            amenities = ", ".join(sample(BULK_AMENITIES, randrange(1, 5)))
+            yield dict(hotel_id=hotel_id, number=f"{n:02d}", type=room_type, max_guests=max_guests,
+                       description=room_type, amenities=amenities, price=price)
+
+
+def _bulk_bookings(rooms, bookings: int, total_rooms: int, first_guest_id: int, guests: int,
+                   start_date: date = BULK_START_DATE):
+    # the bookings are spread evenly over the rooms and never overlap within a room
+    per_room, remainder = divmod(bookings, total_rooms)
+    for i, (hotel_id, number) in enumerate(rooms):
+        k = per_room + (1 if i < remainder else 0)
+        if k == 0:
+            continue
+        gap = max(1, 365 // k - 3)
+        day = start_date + datetime.timedelta(days=randrange(gap))
+        for _ in range(k):
+            end_day = day + datetime.timedelta(days=randrange(1, 6))
+            yield dict(room_hotel_id=hotel_id, room_number=number, guest_id=first_guest_id + randrange(guests),
+                       number_of_guests=1, start_date=day, end_date=end_day)
+            day = end_day + datetime.timedelta(days=1 + randrange(gap))
+
+
+def _max_ids(connection) -> dict:
+    return {
+        "address": connection.execute(select(func.coalesce(func.max(Address.id), 0))).scalar(),
+        "hotel": connection.execute(select(func.coalesce(func.max(Hotel.id), 0))).scalar(),
+        "guest": connection.execute(select(func.coalesce(func.max(Guest.id), 0))).scalar(),
+    }
+
+
+def generate_bulk_data(engine: Engine, hotels: int = 1_000, rooms_per_hotel: int = 20, guests: int = 10_000,
+                       bookings: int = 100_000, s: int = 1, chunk_size: int = 10_000, verbose: bool = False,
+                       id_offsets: dict = None, room_nights: bool = True, hotel_fts: bool = True,
+                       room_amenities: bool = True, start_date: date = BULK_START_DATE) -> dict:
+    seed(s)
+    with engine.begin() as connection:
+        # explicit ids, so the rows can be appended to an existing database without lookups
+        id_offsets = id_offsets or _max_ids(connection)
+        address_offset = id_offsets["address"]
+        hotel_offset = id_offsets["hotel"]
+        guest_offset = id_offsets["guest"]
+        if hotel_fts:
+            # the triggers would rewrite a hotel's document for each of its rooms, it is written once at the end
+            drop_hotel_fts_triggers(connection)
+
+        counts = {}
+        counts["address"] = _insert_chunked(connection, Address, (
+            dict(id=address_offset + i, street=f"Bahnhofstrasse {i}", zip=f"{1000 + i % 9000}",
+                 city=choice(BULK_CITIES))
+            for i in range(1, hotels + guests + 1)
+        ), chunk_size)
+        counts["hotel"] = _insert_chunked(connection, Hotel, (
+            dict(id=hotel_offset + i, name=f"Hotel {hotel_offset + i}", stars=randrange(1, 6),
+                 address_id=address_offset + i)
+            for i in range(1, hotels + 1)
+        ), chunk_size)
+        first_room_id = connection.execute(select(func.coalesce(func.max(Room.id), 0))).scalar() + 1
+        counts["room"] = _insert_chunked(connection, Room, _bulk_rooms(hotel_offset + 1, hotels, rooms_per_hotel),
+                                         chunk_size)
+        if room_amenities:
+            counts["room_amenity"] = fill_room_amenities(connection, first_room_id, chunk_size)
+        counts["guest"] = _insert_chunked(connection, Guest, (
+            dict(id=guest_offset + i, firstname=f"Guest{guest_offset + i}", lastname="Generated",
+                 email=f"guest{guest_offset + i}@example.com", address_id=address_offset + hotels + i, type="guest")
+            for i in range(1, guests + 1)
+        ), chunk_size)
+
+        counts["booking"] = 0
+        first_booking_id = connection.execute(select(func.coalesce(func.max(Booking.id), 0))).scalar() + 1
+        if bookings and counts["room"] and guests:
+            rooms = connection.execute(
+                select(Room.hotel_id, Room.number)
+                .where(Room.hotel_id > hotel_offset)
+                .order_by(Room.hotel_id, Room.number)
+                .execution_options(yield_per=chunk_size)
+            )
+            counts["booking"] = _insert_chunked(connection, Booking,
+                                                _bulk_bookings(rooms, bookings, counts["room"], guest_offset + 1,
+                                                               guests, start_date), chunk_size)
+        if room_nights:
+            counts["room_night"] = fill_room_nights(connection, first_booking_id)
+        if hotel_fts:
+            fill_hotel_fts(connection, hotel_offset + 1)
+            create_hotel_fts_triggers(connection)
+
+    if verbose:
+        print("#" * 50)
+        for table, count in counts.items():
+            print(f"{table.capitalize()} rows added:", count)
+        print("#" * 50)
+    return counts
+
+
+# tables of the bulk data in insert order; room and booking ids are assigned again when the shards are merged
+SHARD_TABLES = [Address, Hotel, Room, Guest, Booking]
+SHARD_RENUMBERED_TABLES = [Room, Booking]
+
+
+def _split(total: int, parts: int) -> list:
+    size, remainder = divmod(total, parts)
+    return [size + (1 if i < remainder else 0) for i in range(parts)]
+
+
+def _generate_shard(shard_file: str, id_offsets: dict, hotels: int, rooms_per_hotel: int, guests: int,
+                    bookings: int, s: int, chunk_size: int, start_date: date) -> dict:
+    # shards are temporary, durability does not matter
+    engine = create_db_engine(shard_file, pragmas={"journal_mode": "OFF", "synchronous": "OFF"})
+    Base.metadata.create_all(engine)
+    # the room nights refer to booking ids, they are derived after the merge renumbered the bookings;
+    # the shards have no full-text index and the room ids change as well, both are filled after the merge
+    counts = generate_bulk_data(engine, hotels, rooms_per_hotel, guests, bookings, s, chunk_size,
+                                id_offsets=id_offsets, room_nights=False, hotel_fts=False, room_amenities=False,
+                                start_date=start_date)
+    engine.dispose()
+    return counts
+
+
+def _merge_shard(connection, shard_file: str):
+    connection.exec_driver_sql("ATTACH DATABASE ? AS shard", (shard_file,))
+    for model in SHARD_TABLES:
+        columns = [column.name for column in model.__table__.columns
+                   if not (model in SHARD_RENUMBERED_TABLES and column.primary_key)]
+        column_list = ", ".join(columns)
+        connection.exec_driver_sql(f"INSERT INTO main.{model.__tablename__} ({column_list}) "
+                                   f"SELECT {column_list} FROM shard.{model.__tablename__} ORDER BY id")
+    connection.commit()
+    connection.exec_driver_sql("DETACH DATABASE shard")
+
+
+def generate_bulk_data_parallel(db_file: str, hotels: int = 1_000, rooms_per_hotel: int = 20, guests: int = 10_000,
+                                bookings: int = 100_000, s: int = 1, chunk_size: int = 10_000, shards: int = None,
+                                verbose: bool = False, start_date: date = BULK_START_DATE) -> dict:
+    shards = shards or os.cpu_count() or 1
+    hotels_per_shard = _split(hotels, shards)
+    guests_per_shard = _split(guests, shards)
+    bookings_per_shard = _split(bookings, shards)
+
+    engine = create_db_engine(db_file)
+    with engine.connect() as connection:
+        base_ids = _max_ids(connection)
+
+    # every shard gets its own id range and seed, so the result only depends on s and the number of shards
+    jobs = []
+    offsets = dict(base_ids)
+    with tempfile.TemporaryDirectory() as tmp:
+        for shard in range(shards):
+            shard_file = str(Path(tmp).joinpath(f"shard_{shard}.db"))
+            jobs.append((shard_file, dict(offsets), hotels_per_shard[shard], rooms_per_hotel, guests_per_shard[shard],
+                         bookings_per_shard[shard], s * 10_000 + shard, chunk_size, start_date))
+            offsets["address"] += hotels_per_shard[shard] + guests_per_shard[shard]
+            offsets["hotel"] += hotels_per_shard[shard]
+            offsets["guest"] += guests_per_shard[shard]
+
+        with Pool(min(shards, os.cpu_count() or 1)) as pool:
+            shard_counts = pool.starmap(_generate_shard, jobs)
+
+        with engine.connect() as connection:
+            first_booking_id = connection.execute(select(func.coalesce(func.max(Booking.id), 0))).scalar() + 1
+            first_room_id = connection.execute(select(func.coalesce(func.max(Room.id), 0))).scalar() + 1
+            drop_hotel_fts_triggers(connection)
+            connection.commit()
+            try:
+                for job in jobs:
+                    _merge_shard(connection, job[0])
+                room_night_count = fill_room_nights(connection, first_booking_id)
+                room_amenity_count = fill_room_amenities(connection, first_room_id, chunk_size)
+                connection.commit()
+            finally:
+                # each merge commits, so after a failure the merged hotels need their documents as well;
+                # without the triggers the index would go stale unnoticed, migrate_db does not recreate them
+                if connection.in_transaction():
+                    connection.rollback()
+                fill_hotel_fts(connection, base_ids["hotel"] + 1)
+                create_hotel_fts_triggers(connection)
+                connection.commit()
+    engine.dispose()
+
+    counts = {table: sum(shard[table] for shard in shard_counts) for table in shard_counts[0]}
+    counts["room_night"] = room_night_count
+    counts["room_amenity"] = room_amenity_count
+    if verbose:
+        print("#" * 50)
+        print("Shards merged:", shards)
+        for table, count in counts.items():
+            print(f"{table.capitalize()} rows added:", count)
+        print("#" * 50)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streams large amounts of random hotels, rooms, guests and "
+                                                 "bookings into a database.")
+    parser.add_argument("--db-file", default=get_db_file())
+    parser.add_argument("--hotels", type=int, default=1_000)
+    parser.add_argument("--rooms-per-hotel", type=int, default=20)
+    parser.add_argument("--guests", type=int, default=10_000)
+    parser.add_argument("--bookings", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--start-date", type=date.fromisoformat, default=BULK_START_DATE,
+                        help="first day of the generated bookings (YYYY-MM-DD)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="generate the data in this many processes and merge the shards, 0 = one per CPU")
+    args = parser.parse_args()
+
+    new_database = not Path(args.db_file).is_file()
+    init_db(args.db_file, migrate=True)
+    engine = create_db_engine(args.db_file)
+    if new_database:
+        generate_system_data(engine, verbose=True)
+    if args.shards == 1:
+        generate_bulk_data(engine, args.hotels, args.rooms_per_hotel, args.guests, args.bookings, args.seed,
+                           args.chunk_size, verbose=True, start_date=args.start_date)
+    else:
+        generate_bulk_data_parallel(args.db_file, args.hotels, args.rooms_per_hotel, args.guests, args.bookings,
+                                    args.seed, args.chunk_size, args.shards or None, verbose=True,
+                                    start_date=args.start_date)
+    engine.dispose()
@@ -0,0 +1,199 @@
+import csv
+import gzip
+import json
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import Connection, select, insert, func
+
+from data_access.amenities import fill_room_amenities
+from data_access.hotel_fts import create_hotel_fts_triggers, drop_hotel_fts_triggers, fill_hotel_fts
+from data_models.models import Address, Hotel, Room
+
+# one line per room, the hotel and address columns are repeated for every room of a hotel
+HOTEL_FIELDS = ["hotel_key", "hotel_name", "stars", "street", "zip", "city"]
+ROOM_FIELDS = ["room_number", "room_type", "max_guests", "description", "amenities", "price"]
+# bookings refer to an imported hotel by hotel_key or to an existing one by hotel_id
+BOOKING_FIELDS = ["hotel_key", "hotel_id", "room_number", "guest_id", "number_of_guests", "start_date", "end_date",
+                  "comment"]
+
+
+def read_rows(file_name: str):
+    # CSV or JSON Lines, optionally gzip compressed ("hotels.jsonl.gz"), as (line number, dict)
+    suffixes = [suffix.lower() for suffix in Path(file_name).suffixes]
+    if ".gz" in suffixes:
+        file = gzip.open(file_name, "rt", encoding="utf-8", newline="")
+    else:
+        file = open(file_name, "r", encoding="utf-8", newline="")
+    with file:
+        if ".jsonl" in suffixes:
+            for line, text in enumerate(file, 1):
+                if text.strip():
+                    try:
+                        value = json.loads(text)
+                    except json.JSONDecodeError as e:
+                        yield line, {"_error": f"Invalid JSON: {e}"}
+                        continue
+                    if not isinstance(value, dict):
+                        value = {"_error": "line is not a JSON object"}
+                    yield line, value
+        else:
+            # the header is line 1
+            for line, row in enumerate(csv.DictReader(file), 2):
+                yield line, row
+
+
+def _text(row: dict, field: str, required: bool = True):
+    value = row.get(field)
+    if type(value) is not str:
+        value = str(value) if value is not None else ""
+    value = value.strip()
+    if not value:
+        if required:
+            raise ValueError(f"{field} is missing")
+        return None
+    return value
+
+
+def _number(row: dict, field: str, convert, minimum=None, maximum=None, required: bool = True):
+    value = _text(row, field, required)
+    if value is None:
+        return None
+    try:
+        number = convert(value)
+    except ValueError:
+        raise ValueError(f"{field} is not a valid number: {value!r}")
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise ValueError(f"{field} is out of range: {value!r}")
+    return number
+
+
+def _date(row: dict, field: str) -> date:
+    value = _text(row, field)
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{field} is not an ISO date (YYYY-MM-DD): {value!r}")
+
+
+def parse_hotel(row: dict) -> tuple:
+    if "_error" in row:
+        raise ValueError(row["_error"])
+    return (
+        _text(row, "hotel_key"),
+        _text(row, "hotel_name"),
+        _number(row, "stars", int, 0, 5),
+        _text(row, "street"),
+        _text(row, "zip"),
+        _text(row, "city")
+    )
+
+
+def parse_room(row: dict) -> dict:
+    return dict(
+        number=_text(row, "room_number"),
+        type=_text(row, "room_type", required=False),
+        max_guests=_number(row, "max_guests", int, 1),
+        description=_text(row, "description", required=False),
+        amenities=_text(row, "amenities", required=False),
+        price=_number(row, "price", float, 0)
+    )
+
+
+def parse_booking_row(row: dict, hotel_ids: dict) -> dict:
+    if "_error" in row:
+        raise ValueError(row["_error"])
+    hotel_id = _number(row, "hotel_id", int, 1, required=False)
+    if hotel_id is None:
+        hotel_key = _text(row, "hotel_key")
+        hotel_id = hotel_ids.get(hotel_key)
+        if hotel_id is None:
+            raise ValueError(f"hotel_key {hotel_key!r} was not imported")
+    booking = dict(
+        room_hotel_id=hotel_id,
+        room_number=_text(row, "room_number"),
+        guest_id=_number(row, "guest_id", int, 1),
+        number_of_guests=_number(row, "number_of_guests", int, 1),
+        start_date=_date(row, "start_date"),
+        end_date=_date(row, "end_date"),
+        comment=_text(row, "comment", required=False)
+    )
+    if booking["start_date"] > booking["end_date"]:
+        raise ValueError("end_date is before start_date")
+    return booking
+
+
+def import_hotels(connection: Connection, rows, chunk_size: int = 10_000, errors: list = None) -> dict:
+    # invalid rows are skipped and reported with their line number; the caller commits,
+    # or rolls back for a dry run
+    errors = errors if errors is not None else []
+    # explicit ids, the rooms of a chunk can reference hotels of the same chunk without lookups
+    next_address_id = connection.execute(select(func.coalesce(func.max(Address.id), 0))).scalar() + 1
+    next_hotel_id = connection.execute(select(func.coalesce(func.max(Hotel.id), 0))).scalar() + 1
+    first_hotel_id = next_hotel_id
+    first_room_id = connection.execute(select(func.coalesce(func.max(Room.id), 0))).scalar() + 1
+    # the full-text documents of the new hotels are written once at the end instead of once per room
+    drop_hotel_fts_triggers(connection)
+
+    hotels = {}  # raw hotel_key -> (hotel_id, raw hotel columns, first line, room numbers, hotel_key)
+    addresses, new_hotels, rooms = [], [], []
+    room_count = 0
+
+    def flush():
+        nonlocal room_count
+        if addresses:
+            connection.execute(insert(Address), addresses)
+            connection.execute(insert(Hotel), new_hotels)
+        if rooms:
+            connection.execute(insert(Room), rooms)
+            room_count += len(rooms)
+        addresses.clear()
+        new_hotels.clear()
+        rooms.clear()
+
+    for line, row in rows:
+        try:
+            if "_error" in row:
+                raise ValueError(row["_error"])
+            # the hotel columns are only parsed for the first room of a hotel, later rooms must repeat them
+            raw_hotel = tuple(row.get(field) for field in HOTEL_FIELDS)
+            known = hotels.get(raw_hotel[0])
+            if known is None:
+                hotel_key, name, stars, street, zip_code, city = parse_hotel(row)
+                room = parse_room(row)
+                addresses.append(dict(id=next_address_id, street=street, zip=zip_code, city=city))
+                new_hotels.append(dict(id=next_hotel_id, name=name, stars=stars, address_id=next_address_id))
+                known = hotels[raw_hotel[0]] = (next_hotel_id, raw_hotel, line, set(), hotel_key)
+                next_address_id += 1
+                next_hotel_id += 1
+            elif known[1] != raw_hotel:
+                raise ValueError(f"hotel columns differ from line {known[2]} of hotel {raw_hotel[0]!r}")
+            else:
+                room = parse_room(row)
+            if room["number"] in known[3]:
+                raise ValueError(f"room {room['number']!r} appears twice in hotel {raw_hotel[0]!r}")
+        except ValueError as e:
+            errors.append(dict(line=line, error=str(e)))
+            continue
+        known[3].add(room["number"])
+        rooms.append(dict(hotel_id=known[0], **room))
+        if len(rooms) >= chunk_size:
+            flush()
+    flush()
+    fill_room_amenities(connection, first_room_id, chunk_size)
+    fill_hotel_fts(connection, first_hotel_id)
+    create_hotel_fts_triggers(connection)
+
+    return {
+        "hotels": len(hotels),
+        "rooms": room_count,
+        "hotel_ids": {known[4]: known[0] for known in hotels.values()},
+        "errors": errors
+    }
+
+
+def write_error_report(errors: list, file_name: str):
+    with open(file_name, "w", encoding="utf-8", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=["file", "line", "error"], extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(errors)
@@ -0,0 +1,84 @@
+import os
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, Engine, URL
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+DEFAULT_DB_FILE = Path(__file__).resolve().parent.parent.joinpath("data", "database.db")
+
+# applied to every new connection, see https://www.sqlite.org/pragma.html
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # negative values are KiB
+    "busy_timeout": 5000,  # ms
+}
+
+# read-only connections cannot switch the journal mode, they only prevent writes
+READ_ONLY_PRAGMAS = {
+    "query_only": "ON",
+}
+
+WRITE_POOL_SIZE = 1
+READ_POOL_SIZE = 8
+
+
+def get_db_file() -> str:
+    return os.environ.get("DB_FILE", str(DEFAULT_DB_FILE))
+
+
+def create_db_engine(file_path: str = None, pragmas: dict = None, pool_size: int = 5, max_overflow: int = 10,
+                     read_only: bool = False, **kwargs) -> Engine:
+    file_path = file_path or get_db_file()
+    settings = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+    if read_only:
+        settings.pop("journal_mode")
+        settings.update(READ_ONLY_PRAGMAS)
+        # every statement runs in its own read transaction and sees the latest commit
+        kwargs.setdefault("isolation_level", "AUTOCOMMIT")
+        # as_uri percent-encodes "?", "#" and "%" of the path
+        url = URL.create("sqlite", database=f"{Path(file_path).resolve().as_uri()}?mode=ro", query={"uri": "true"})
+    else:
+        url = URL.create("sqlite", database=str(file_path))
+    engine = create_engine(url, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in settings.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+def create_session(file_path: str = None, pragmas: dict = None, pool_size: int = WRITE_POOL_SIZE,
+                   read_only: bool = False, **kwargs) -> scoped_session:
+    engine = create_db_engine(file_path, pragmas, pool_size=pool_size, max_overflow=pool_size, read_only=read_only,
+                              **kwargs)
+    return scoped_session(sessionmaker(bind=engine))
+
+
+def create_sessions(file_path: str = None, pragmas: dict = None, write_pool_size: int = WRITE_POOL_SIZE,
+                    read_pool_size: int = READ_POOL_SIZE, **kwargs):
+    '''
+    Erstellt eine Session für Schreibzugriffe und eine für Lesezugriffe, jeweils mit
+    eigenem Connection Pool. SQLite erlaubt nur einen Schreiber gleichzeitig, deshalb
+    ist der Schreib-Pool klein und der Lese-Pool grösser. Die Lese-Session verwendet
+    schreibgeschützte Verbindungen (mode=ro, query_only), so blockieren lange Suchen
+    keine Buchungen. Jede Abfrage der Lese-Session ist eine eigene Lesetransaktion
+    und überschreibt bereits geladene Objekte, sie sieht also auch Commits anderer
+    Threads und Prozesse.
+    '''
+    write_session = create_session(file_path, pragmas, write_pool_size, **kwargs)
+    read_session = create_session(file_path, pragmas, read_pool_size, read_only=True, **kwargs)
+
+    # a commit hook would only reach the read session of the committing thread and never other processes;
+    # instead every query refreshes the objects it returns from the row it just read
+    @event.listens_for(read_session.session_factory, "do_orm_execute")
+    def refresh_loaded_objects(orm_execute_state):
+        if orm_execute_state.is_select:
+            orm_execute_state.update_execution_options(populate_existing=True)
+
+    return write_session, read_session
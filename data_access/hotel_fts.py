@@ -0,0 +1,116 @@
+import re
+
+from sqlalchemy import Connection, Engine, table, column, select, literal_column
+
+# full-text index over hotel name, address and the room descriptions, one document per hotel with rowid = hotel.id;
+# diacritics are removed so "Zurich" finds "Zürich"; the prefix indexes answer prefixes of up to 6 characters
+# without merging the lists of all matching words, a common prefix like "hotel"* costs 4 instead of 16 ms
+CREATE_HOTEL_FTS = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS hotel_fts USING fts5(
+        name, city, street, rooms,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4 5 6'
+    )
+"""
+
+# matches in the name count most, the room texts least
+HOTEL_FTS_RANK = "bm25(10.0, 5.0, 2.0, 1.0)"
+
+HOTEL_FTS_DOCUMENT = """
+    INSERT INTO hotel_fts (rowid, name, city, street, rooms)
+    SELECT hotel.id, hotel.name, address.city, address.street,
+           (SELECT group_concat(coalesce(room.description, '') || ' ' || coalesce(room.amenities, ''), ' ')
+            FROM room WHERE room.hotel_id = hotel.id)
+    FROM hotel JOIN address ON address.id = hotel.address_id
+"""
+
+
+def _refresh(condition: str) -> str:
+    # writes the documents of the hotels matching the condition again
+    return f"""
+        DELETE FROM hotel_fts WHERE rowid IN (SELECT hotel.id FROM hotel WHERE {condition});
+        {HOTEL_FTS_DOCUMENT} WHERE {condition};
+    """
+
+
+HOTEL_FTS_TRIGGERS = {
+    "hotel_fts_hotel_insert": f"AFTER INSERT ON hotel BEGIN {_refresh('hotel.id = new.id')} END",
+    "hotel_fts_hotel_update": f"""AFTER UPDATE OF name, address_id ON hotel BEGIN
+        DELETE FROM hotel_fts WHERE rowid = old.id; {_refresh('hotel.id = new.id')} END""",
+    "hotel_fts_hotel_delete": "AFTER DELETE ON hotel BEGIN DELETE FROM hotel_fts WHERE rowid = old.id; END",
+    "hotel_fts_address_update": f"AFTER UPDATE OF street, city ON address BEGIN "
+                                f"{_refresh('hotel.address_id = new.id')} END",
+    "hotel_fts_room_insert": f"AFTER INSERT ON room BEGIN {_refresh('hotel.id = new.hotel_id')} END",
+    "hotel_fts_room_update": f"""AFTER UPDATE OF hotel_id, description, amenities ON room BEGIN
+        {_refresh('hotel.id = old.hotel_id')} {_refresh('hotel.id = new.hotel_id')} END""",
+    "hotel_fts_room_delete": f"AFTER DELETE ON room BEGIN {_refresh('hotel.id = old.hotel_id')} END",
+}
+
+# for queries, rank orders by the configured bm25 weights (smaller is better)
+hotel_fts = table("hotel_fts", column("rowid"), column("rank"), column("name"), column("city"), column("street"),
+                  column("rooms"))
+
+_TOKEN = re.compile(r"\w+")
+
+
+def create_hotel_fts(connection: Connection, triggers: bool = True):
+    connection.exec_driver_sql(CREATE_HOTEL_FTS)
+    connection.exec_driver_sql(f"INSERT INTO hotel_fts (hotel_fts, rank) VALUES ('rank', '{HOTEL_FTS_RANK}')")
+    if triggers:
+        create_hotel_fts_triggers(connection)
+
+
+def create_hotel_fts_triggers(connection: Connection):
+    for name, trigger in HOTEL_FTS_TRIGGERS.items():
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {trigger}")
+
+
+def drop_hotel_fts_triggers(connection: Connection):
+    # bulk loads drop the triggers and write the documents once at the end; pysqlite only opens a transaction
+    # for DML, without an explicit BEGIN the DROP would be committed at once and survive a rollback (dry run)
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN")
+    for name in HOTEL_FTS_TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def drop_hotel_fts(connection: Connection):
+    drop_hotel_fts_triggers(connection)
+    connection.exec_driver_sql("DROP TABLE IF EXISTS hotel_fts")
+
+
+def fill_hotel_fts(connection: Connection, first_hotel_id: int = 1) -> int:
+    # (re)writes the documents of the hotels from first_hotel_id on
+    connection.exec_driver_sql("DELETE FROM hotel_fts WHERE rowid >= ?", (first_hotel_id,))
+    return connection.exec_driver_sql(f"{HOTEL_FTS_DOCUMENT} WHERE hotel.id >= ?", (first_hotel_id,)).rowcount
+
+
+def rebuild_hotel_fts(engine: Engine) -> int:
+    with engine.begin() as connection:
+        count = fill_hotel_fts(connection)
+        connection.exec_driver_sql("INSERT INTO hotel_fts (hotel_fts) VALUES ('optimize')")
+        return count
+
+
+def match_expression(search: str, columns=None) -> str:
+    # every word of the input must match as a prefix, in one of the given columns;
+    # words are quoted, so the input cannot use the FTS5 query syntax
+    tokens = _TOKEN.findall(search)
+    if not tokens:
+        return None
+    column_filter = ""
+    if columns:
+        column_filter = "{" + " ".join(columns) + "} : "
+    return " AND ".join(f'{column_filter}"{token}"*' for token in tokens)
+
+
+def hotel_fts_matches(expression: str):
+    return literal_column("hotel_fts").op("MATCH")(expression)
+
+
+def match_hotel_ids(search: str, columns=None):
+    # hotel ids whose document matches, for Hotel.id.in_(...); None if the input has no words
+    expression = match_expression(search, columns)
+    if expression is None:
+        return None
+    return select(hotel_fts.c.rowid).where(hotel_fts_matches(expression))
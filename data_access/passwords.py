@@ -0,0 +1,103 @@
+import base64
+import functools
+import hashlib
+import hmac
+import os
+
+from sqlalchemy import Connection, select, update
+
+from data_models.models import Login
+
+# stored as "scrypt$n$r$p$salt$hash" (base64), about 60 ms and 16 MB per verification;
+# PBKDF2 is used where Python was built against an OpenSSL without scrypt
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600_000
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+_SCRYPT = "scrypt"
+_PBKDF2 = "pbkdf2_sha256"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text.encode("ascii"))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem above the 32 MB default of OpenSSL, 128 * n * r bytes are needed
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, dklen=HASH_BYTES,
+                          maxmem=256 * n * r * p)
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations, HASH_BYTES)
+
+
+def hash_password(password: str) -> str:
+    salt = os.urandom(SALT_BYTES)
+    if hasattr(hashlib, "scrypt"):
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"{_SCRYPT}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}"
+    digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+    return f"{_PBKDF2}${PBKDF2_ITERATIONS}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def is_password_hash(stored: str) -> bool:
+    return stored is not None and stored.split("$", 1)[0] in (_SCRYPT, _PBKDF2) and stored.count("$") >= 3
+
+
+def verify_password(password: str, stored: str) -> bool:
+    # plaintext rows of older databases are compared as they are, the caller stores a hash afterwards
+    if stored is None or password is None:
+        return False
+    if not is_password_hash(stored):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    parts = stored.split("$")
+    try:
+        if parts[0] == _SCRYPT:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            digest = _scrypt(password, _b64decode(parts[4]), n, r, p)
+            expected = _b64decode(parts[5])
+        else:
+            digest = _pbkdf2(password, _b64decode(parts[2]), int(parts[1]))
+            expected = _b64decode(parts[3])
+    except (IndexError, ValueError):
+        return False
+    return hmac.compare_digest(digest, expected)
+
+
+def needs_rehash(stored: str) -> bool:
+    # plaintext, or hashed with other parameters than new passwords get
+    if not is_password_hash(stored):
+        return True
+    parts = stored.split("$")
+    if hasattr(hashlib, "scrypt"):
+        return parts[:4] != [_SCRYPT, str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+    return parts[:2] != [_PBKDF2, str(PBKDF2_ITERATIONS)]
+
+
+@functools.cache
+def _dummy_hash() -> str:
+    return hash_password("")
+
+
+def verify_unknown_user(password: str) -> bool:
+    # same work as for an existing user, so the response time does not reveal valid usernames
+    verify_password(password or "", _dummy_hash())
+    return False
+
+
+def hash_plaintext_passwords(connection: Connection) -> int:
+    # logins written before passwords were hashed; a handful of rows, hashed one by one
+    count = 0
+    for login_id, password in connection.execute(select(Login.id, Login.password)).all():
+        if password is not None and not is_password_hash(password):
+            connection.execute(update(Login).where(Login.id == login_id).values(password=hash_password(password)))
+            count += 1
+    return count
@@ -3,11 +3,12 @@ from __future__ import annotations
 from datetime import date
 
 from typing import List
-from sqlalchemy import ForeignKey, ForeignKeyConstraint
+from sqlalchemy import ForeignKey, ForeignKeyConstraint, Index, String
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm import configure_mappers
 from sqlalchemy.ext.hybrid import hybrid_property
 
 
@@ -130,9 +131,17 @@ class Room(Base):
     type: Mapped[str] = mapped_column("type", nullable=True) # e.g. "family room", "single room", etc.
     max_guests: Mapped[int] = mapped_column("max_guests")
     description: Mapped[str] = mapped_column("description", nullable=True) # e.g. "Room with sea view"
-    amenities: Mapped[str] = mapped_column("amenities", nullable=True)
+    amenities: Mapped[str] = mapped_column("amenities", nullable=True) # e.g. "TV, Caffe Machine"
+    # parsed from amenities and written by data_access.amenities, therefore read only
+    amenity_list: Mapped[List["Amenity"]] = relationship(secondary="room_amenity", viewonly=True,
+                                                         order_by="Amenity.name")
     price: Mapped[float] = mapped_column("price")
 
+    __table_args__ = (
+        Index("ix_room_hotel_id_number", "hotel_id", "number"),
+        Index("ix_room_hotel_id_max_guests", "hotel_id", "max_guests"),
+    )
+
     def __repr__(self) -> str:
         return f"Room(hotel={self.hotel!r}, room_number={self.number!r}, type={self.type!r}, description={self.description!r}, amenities={self.amenities!r}, price={self.price!r})"
 
@@ -159,7 +168,74 @@ class Booking(Base):
             ['room_hotel_id', 'room_number'],
             ['room.hotel_id', 'room.number'],
         ),
+        Index("ix_booking_room_dates", "room_hotel_id", "room_number", "start_date", "end_date"),
+        Index("ix_booking_dates", "start_date", "end_date"),
+        Index("ix_booking_guest_id", "guest_id"),
     )
 
     def __repr__(self) -> str:
         return f"Booking(room={self.room!r}, guest={self.guest!r}, start_date={self.start_date!r}, end_date={self.end_date!r}, comment={self.comment!r})"
+
+
+
+class RoomNight(Base):
+    '''
+    Belegte Nacht eines Zimmers, eine Zeile pro Zimmer und Tag einer Buchung (Enddatum inklusive).
+    Wird aus der Tabelle booking abgeleitet und vom BookingManager nachgeführt.
+    '''
+    __tablename__ = "room_night"
+
+    room_hotel_id: Mapped[int] = mapped_column("room_hotel_id", primary_key=True)
+    room_number: Mapped[str] = mapped_column("room_number", primary_key=True)
+    night: Mapped[date] = mapped_column("night", primary_key=True)
+    booking_id: Mapped[int] = mapped_column("booking_id", ForeignKey("booking.id"), primary_key=True)
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ['room_hotel_id', 'room_number'],
+            ['room.hotel_id', 'room.number'],
+        ),
+        Index("ix_room_night_booking_id", "booking_id"),
+        Index("ix_room_night_night", "night"),
+        # the primary key is the table, no separate rowid b-tree
+        {"sqlite_with_rowid": False},
+    )
+
+    def __repr__(self) -> str:
+        return f"RoomNight(room_hotel_id={self.room_hotel_id!r}, room_number={self.room_number!r}, night={self.night!r}, booking_id={self.booking_id!r})"
+
+
+class Amenity(Base):
+    '''
+    Ausstattungsmerkmal eines Zimmers (z.B. "TV"), der Name ist ohne Beachtung der Gross-/Kleinschreibung eindeutig.
+    '''
+    __tablename__ = "amenity"
+
+    id: Mapped[int] = mapped_column("id", primary_key=True)
+    name: Mapped[str] = mapped_column("name", String(collation="NOCASE"), unique=True)
+
+    def __repr__(self) -> str:
+        return f"Amenity(id={self.id!r}, name={self.name!r})"
+
+
+class RoomAmenity(Base):
+    '''
+    Zuordnung der Ausstattungsmerkmale zu den Zimmern, abgeleitet aus room.amenities.
+    '''
+    __tablename__ = "room_amenity"
+
+    room_id: Mapped[int] = mapped_column("room_id", ForeignKey("room.id"), primary_key=True)
+    amenity_id: Mapped[int] = mapped_column("amenity_id", ForeignKey("amenity.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_room_amenity_amenity_id", "amenity_id", "room_id"),
+        # the primary key is the table, no separate rowid b-tree
+        {"sqlite_with_rowid": False},
+    )
+
+    def __repr__(self) -> str:
+        return f"RoomAmenity(room_id={self.room_id!r}, amenity_id={self.amenity_id!r})"
+
+
+# resolve all relationships once at import instead of on the first query of the running application
+configure_mappers()
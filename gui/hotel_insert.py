@@ -3,9 +3,10 @@ import sys
 from PyQt5 import QtCore, QtGui
 from PyQt5 import uic
 from PyQt5.QtWidgets import QLineEdit, QComboBox, QPushButton, QMainWindow, QApplication, QMessageBox
-from sqlalchemy import create_engine, exc
+from sqlalchemy import exc
 from sqlalchemy.orm import Session
 
+from data_access.engine_factory import create_db_engine
 from data_models.models import *
 
 
@@ -86,7 +87,7 @@ class HotelUIForm(QMainWindow):
         result_ort, _, _ = ort_validator.validate(self.lineEdit_ort.text(), 0)
 
         if result_name and result_strasse and result_plz and result_ort == QtGui.QValidator.Acceptable == QtGui.QValidator.Acceptable:
-            engine = create_engine("sqlite:///data/example.db", echo=True)
+            engine = create_db_engine("data/example.db", echo=True)
             try:
                 engine.connect()
                 print("Connection successful")
@@ -1,10 +1,15 @@
+import sys
+import threading
+
 from PyQt5 import uic
-from PyQt5.QtWidgets import QMainWindow, QLineEdit, QPushButton, QTableView, QHeaderView
-from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtWidgets import QMainWindow, QLineEdit, QPushButton, QTableView, QHeaderView, QApplication
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
 
-from sqlalchemy import func
+from sqlalchemy import func, select, exc
 from sqlalchemy.orm import Session
 
+from data_access.engine_factory import get_db_file, create_sessions
+from data_access.hotel_fts import match_hotel_ids
 from data_models.models import *
 
 
@@ -17,19 +22,91 @@ class HotelTableView(QMainWindow):
         self.hotelTableView: QTableView = self.hotelTableView
         self.session = session
         self.hotelTableModel = HotelTableModel(self, self.session)
-        self.hotelTableModel.all()
         self.hotelTableView.setModel(self.hotelTableModel)
 
-        self.hotelTableView.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
-        self.hotelTableView.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeToContents)
-        self.hotelTableView.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents)
         self.hotelTableView.horizontalHeader().setSectionResizeMode(3, QHeaderView.Stretch)
+        self.hotelTableView.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.hotelTableModel.rowsInserted.connect(self.rows_inserted)
+        self.hotelTableModel.all()
+
+        # search as you type, started once the user pauses typing
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(HotelTableView.SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.btn_search_clicked)
+        self.txt_name.textChanged.connect(self.search_timer.start)
 
         self.btn_search.clicked.connect(self.btn_search_clicked)
 
+    # ms without typing before the search starts
+    SEARCH_DELAY_MS = 250
+
     def btn_search_clicked(self):
+        self.search_timer.stop()
         self.hotelTableModel.search_name(self.txt_name.text())
-        self.hotelTableView.viewport().update()
+
+    def rows_inserted(self, parent: QModelIndex, first: int, last: int):
+        # sized from the first page, ResizeToContents would measure every fetched row on each change
+        if first == 0:
+            self.hotelTableView.resizeColumnsToContents()
+
+    def closeEvent(self, event):
+        self.hotelTableModel.close()
+        super().closeEvent(event)
+
+
+class HotelPageSignals(QObject):
+    # generation of the search, formatted rows of the page
+    page_loaded = pyqtSignal(int, list)
+    failed = pyqtSignal(int, str)
+
+
+class HotelPageWorker(QRunnable):
+    '''
+    Lädt eine Seite der Hoteltabelle in einem Thread des QThreadPool mit einer
+    eigenen Session. Eine veraltete Suche wird über cancel() abgebrochen, eine
+    laufende SQLite-Abfrage wird dabei per interrupt() beendet.
+    '''
+
+    def __init__(self, bind, query, generation: int):
+        super().__init__()
+        self.bind = bind
+        self.query = query
+        self.generation = generation
+        self.signals = HotelPageSignals()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._dbapi_connection = None
+
+    def run(self):
+        try:
+            with Session(self.bind) as session:
+                connection = session.connection()
+                with self._lock:
+                    if self._cancelled.is_set():
+                        return
+                    self._dbapi_connection = connection.connection.dbapi_connection
+                try:
+                    page = [
+                        (hotel_id, name, number_of_rooms, f"{street}, {zip_code} {city}")
+                        for hotel_id, name, number_of_rooms, street, zip_code, city in session.execute(self.query)
+                    ]
+                finally:
+                    with self._lock:
+                        self._dbapi_connection = None
+        except exc.OperationalError as e:
+            # an interrupted query raises "interrupted"
+            if not self._cancelled.is_set():
+                self.signals.failed.emit(self.generation, str(e.orig))
+            return
+        if not self._cancelled.is_set():
+            self.signals.page_loaded.emit(self.generation, page)
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            if self._dbapi_connection is not None:
+                self._dbapi_connection.interrupt()
 
 
 class HotelTableModel(QAbstractTableModel):
@@ -38,6 +115,9 @@ class HotelTableModel(QAbstractTableModel):
     number_of_rooms = "# of rooms"
     address = "Address"
 
+    # rows loaded per fetchMore, the view asks for more when it scrolls to the end
+    PAGE_SIZE = 200
+
     def __init__(self, parent, session: Session, *args) -> None:
         QAbstractTableModel.__init__(self, parent, *args)
         self.header = [
@@ -47,34 +127,105 @@ class HotelTableModel(QAbstractTableModel):
             HotelTableModel.address
         ]
         self.session = session
-        self.hotels: List[Hotel] = []
+        # formatted cells per row, in header order
+        self.rows: List[tuple] = []
+        self._name_hotel_ids = None
+        self._last_id = 0
+        self._has_more = False
+        # the queries run in the pool, the GUI thread only inserts the loaded pages
+        self._pool = QThreadPool(self)
+        self._worker = None
+        self._generation = 0
 
     def all(self):
-        self.hotels = self.session.query(Hotel).all()
-
-    def search_name(self, like: str):
-        like = like.lower()
-        self.hotels = self.session.query(Hotel).filter(func.lower(Hotel.name).like(f'%{like}%')).all()
-
-    def rowCount(self, parent: QModelIndex = ...) -> int:
-        return len(self.hotels)
-
-    def columnCount(self, parent: QModelIndex = ...) -> int:
+        self._reset(None)
+
+    def search_name(self, name: str):
+        # prefix match of every word in the full-text index, e.g. "grand ol" finds "Grand Hotel Olten"
+        self._reset(match_hotel_ids(name, ["name"]))
+
+    def _reset(self, name_hotel_ids):
+        # results of a previous search are dropped, even if its page is already on the way
+        self._cancel_worker()
+        self._generation += 1
+        self.beginResetModel()
+        self.rows = []
+        self._name_hotel_ids = name_hotel_ids
+        self._last_id = 0
+        self._has_more = True
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def _query_page(self):
+        # keyset pagination on the primary key, every page costs the same however far the user scrolled
+        number_of_rooms = select(func.count()).where(Room.hotel_id == Hotel.id).scalar_subquery()
+        query = select(
+            Hotel.id, Hotel.name, number_of_rooms, Address.street, Address.zip, Address.city
+        ).join(Address, Hotel.address_id == Address.id).where(Hotel.id > self._last_id)
+        if self._name_hotel_ids is not None:
+            query = query.where(Hotel.id.in_(self._name_hotel_ids))
+        return query.order_by(Hotel.id).limit(self.PAGE_SIZE)
+
+    def canFetchMore(self, parent: QModelIndex = QModelIndex()) -> bool:
+        # one page at a time, the next one is requested again once this one is inserted
+        return not parent.isValid() and self._has_more and self._worker is None
+
+    def fetchMore(self, parent: QModelIndex = QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._worker = HotelPageWorker(self.session.get_bind(), self._query_page(), self._generation)
+        self._worker.signals.page_loaded.connect(self._page_loaded)
+        self._worker.signals.failed.connect(self._page_failed)
+        self._pool.start(self._worker)
+
+    def _page_loaded(self, generation: int, page: list):
+        if generation != self._generation:
+            return
+        self._worker = None
+        self._has_more = len(page) == self.PAGE_SIZE
+        if not page:
+            return
+        self._last_id = page[-1][0]
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+        self.rows.extend(page)
+        self.endInsertRows()
+
+    def _page_failed(self, generation: int, message: str):
+        if generation != self._generation:
+            return
+        self._worker = None
+        self._has_more = False
+        print(f"Hotel search failed: {message}", file=sys.stderr)
+
+    def _cancel_worker(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def close(self):
+        self._cancel_worker()
+        self._pool.waitForDone()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
         return len(self.header)
 
-    def data(self, index: QModelIndex, role: int = ...):
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
         if not index.isValid():
             return None
         if role == Qt.DisplayRole:
-            if self.header[index.column()] == HotelTableModel.id:
-                return self.hotels[index.row()].id
-            elif self.header[index.column()] == HotelTableModel.name:
-                return self.hotels[index.row()].name
-            elif self.header[index.column()] == HotelTableModel.number_of_rooms:
-                return len(self.hotels[index.row()].rooms)
-            elif self.header[index.column()] == HotelTableModel.address:
-                return f"{self.hotels[index.row()].address.street}, {self.hotels[index.row()].address.zip} {self.hotels[index.row()].address.city}"
-
-    def headerData(self, section: int, orientation: Qt.Orientation, role: int = ...):
+            return self.rows[index.row()][index.column()]
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole):
         if orientation == Qt.Horizontal and role == Qt.DisplayRole:
             return self.header[section]
+
+
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    session, read_session = create_sessions(get_db_file())
+    window = HotelTableView(read_session)
+    window.show()
+    sys.exit(app.exec())